@@ -1,3 +1,5 @@
 MYEPITECH_LOGIN_URL = "https://login.microsoftonline.com/common/oauth2/authorize?client_id=c3728513-e7f6-497b-b319-619aa86f5b50&nonce=3af93a9f-7735-442c-8733-256c670d5236&redirect_uri=https%3A%2F%2Fmy.epitech.eu%2Findex.html&response_type=id_token&state=fragment%3Dy%252F2024"
 INTRANET_LOGIN_URL =  "https://login.microsoftonline.com/common/oauth2/authorize?response_type=code&client_id=e05d4149-1624-4627-a5ba-7472a39e43ab&redirect_uri=https%3A%2F%2Fintra.epitech.eu%2Fauth%2Foffice365&state=%2F"
-USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:86.0) Gecko/20100101 Firefox/86.0"
\ No newline at end of file
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:86.0) Gecko/20100101 Firefox/86.0"
+CONFIG_RELOAD_INTERVAL = 2  # minutes
+RATE_LIMITED_HOSTS = ["intra.epitech.eu", "api.epitest.eu", "login.microsoftonline.com"]
\ No newline at end of file
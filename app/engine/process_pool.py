@@ -0,0 +1,244 @@
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import CONFIG_RELOAD_INTERVAL
+from app.engine.sharding import rendezvous_owner
+from app.logger import flush_logs, log_info, log_error, log_warning
+from app.model.Student import Student
+from app.tools.config_loader import load_configuration
+from app.tools.status_sender import status_sender
+
+
+class WorkerContext:
+    """
+    Stand-in of Main in a worker process: the managers and intervals used by the scrapes of the worker
+    """
+
+    def __init__(self):
+        from app.intranet.intranet_manager import IntranetManager
+        from app.myepitech.myepitech_manager import MyEpitechManager
+
+        self.myepitech = MyEpitechManager()
+        self.intranet = IntranetManager()
+        self.intervals = {}
+
+
+def run_job(student: Student, job: dict, results):
+    """
+    Scrape a student in a worker, with the scheduling state sent by the parent, and send back the new state
+    """
+    student.last_scrapes = dict(job["last_scrapes"])
+    student.forced_tasks = dict(job["forced_tasks"])
+    student.last_failed_auth = job["last_failed_auth"]
+    student.adaptive_intervals = dict(job["adaptive_intervals"])
+    try:
+        student.scrape_now()
+    except Exception:
+        log_error(traceback.format_exc(), student=student.student_label)
+    finally:
+        results.put({"token": student.tekbetter_token, "last_scrapes": student.last_scrapes,
+                     "last_scrape_start": student.last_scrape_start, "last_failed_auth": student.last_failed_auth,
+                     "push_count": student.push_count, "adaptive_intervals": student.adaptive_intervals})
+
+
+def worker_main(index: int, env: dict, jobs, results):
+    """
+    Worker process: scrape the students sent by the parent, its share of MAX_THREADS at a time.
+    A student always goes to the same worker, which keeps its Student object (tokens, pushed hashes, caches).
+    """
+    from app.tools.config_loader import create_student
+
+    os.environ.update(env)
+    context = WorkerContext()
+    students = {}
+    executor = ThreadPoolExecutor(max_workers=int(os.getenv("MAX_THREADS", 1)),
+                                  thread_name_prefix=f"worker{index}")
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            if job["type"] == "forget":
+                students.pop(job["token"], None)
+                continue
+
+            context.intervals = job["intervals"]
+            student = students.get(job["token"])
+            if student is None:
+                student = students[job["token"]] = create_student(job, context)
+            elif student.microsoft_session != job["microsoft_session"]:
+                student.microsoft_session = job["microsoft_session"]
+                student.reset_tokens()
+            executor.submit(run_job, student, job, results)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=True)
+        status_sender.flush()
+        flush_logs()
+
+
+class Worker:
+    def __init__(self, index: int, threads: int, env: dict, results):
+        self.index = index
+        self.threads = threads
+        self.env = env
+        self.results = results
+        self.jobs = None
+        self.process = None
+        self.in_flight = set()
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.jobs = context.Queue()
+        self.process = context.Process(target=worker_main, name=f"scraper-worker-{self.index}", daemon=True,
+                                       args=(self.index, self.env, self.jobs, self.results))
+        self.process.start()
+
+
+class ProcessEngine:
+    """
+    Scrape engine spreading the students over SCRAPER_PROCESSES worker processes, so the JSON decoding,
+    filtering and encoding of the scrapes run on every core instead of sharing one GIL.
+    The parent process keeps the scheduling, the config reloads and the server API: it sends each due student
+    with its scheduling state (intervals, adaptive intervals, last scrapes, triggered tasks) to the worker owning it, and gets back
+    the new state when the scrape is done. The workers share MAX_THREADS (the students scraped at a time) and
+    HTTP_RATE_LIMIT: there are never more workers than threads, nor than requests per second.
+    """
+
+    def __init__(self, main):
+        self.main = main
+        max_threads = max(1, int(os.getenv("MAX_THREADS", 10)))
+        rate = float(os.getenv("HTTP_RATE_LIMIT", 0))
+        self.process_count = max(1, int(os.getenv("SCRAPER_PROCESSES", min(os.cpu_count() or 1, 4))))
+        self.process_count = min(self.process_count, max_threads)
+        if rate > 0:
+            self.process_count = min(self.process_count, max(1, int(rate)))
+        self.results = multiprocessing.get_context("spawn").Queue()
+        self.workers = []
+        for i in range(self.process_count):
+            threads = max_threads // self.process_count + (1 if i < max_threads % self.process_count else 0)
+            env = {"MAX_THREADS": str(threads), "HTTP_RATE_LIMIT": str(rate / self.process_count)}
+            self.workers.append(Worker(i, threads, env, self.results))
+        # Not the bare indexes: static sharding hashes the tokens over the same ids, so every student of a shard
+        # would go to the worker of the shard index
+        self.workers_by_id = {f"worker-{i}": worker for i, worker in enumerate(self.workers)}
+        self.known_tokens = set()
+        self.last_config_update = time.time()
+        self._lock = threading.Lock()
+
+    def worker_of(self, token: str) -> Worker:
+        return self.workers_by_id[rendezvous_owner(token, list(self.workers_by_id))]
+
+    def apply_result(self, result: dict):
+        with self._lock:
+            for worker in self.workers:
+                worker.in_flight.discard(result["token"])
+        student = self.main.get_student(result["token"])
+        if student is None:
+            return
+        student.last_scrapes.update(result["last_scrapes"])
+        student.last_scrape_start = result["last_scrape_start"]
+        student.last_failed_auth = result["last_failed_auth"]
+        student.push_count = result["push_count"]
+        student.adaptive_intervals = result["adaptive_intervals"]
+        # Triggers received after the start of the scrape stay queued
+        for task_type, triggered_at in list(student.forced_tasks.items()):
+            if triggered_at <= student.last_scrape_start <= result["last_scrapes"].get(task_type, 0):
+                student.forced_tasks.pop(task_type, None)
+        student.is_scraping = False
+
+    def read_results(self):
+        while True:
+            result = self.results.get()
+            try:
+                self.apply_result(result)
+            except Exception as e:
+                log_error(f"Failed to apply a worker result: {e}")
+            self.main.wakeup.set()
+
+    def check_workers(self):
+        """
+        Restart the dead workers. The students they were scraping are scheduled again.
+        """
+        for worker in self.workers:
+            if worker.process.is_alive():
+                continue
+            log_warning(f"Worker {worker.index} died (exit code {worker.process.exitcode}), restarting it")
+            with self._lock:
+                lost, worker.in_flight = worker.in_flight, set()
+            for token in lost:
+                student = self.main.get_student(token)
+                if student is not None:
+                    student.is_scraping = False
+            worker.start()
+
+    def forget_removed_students(self):
+        tokens = set(self.main.students_by_token)
+        for token in self.known_tokens - tokens:
+            self.worker_of(token).jobs.put({"type": "forget", "token": token})
+        self.known_tokens = tokens
+
+    def sync_passage(self):
+        students = [s for s in self.main.owned_students()
+                    if not s.is_scraping and s.one_need_scrape() and not s.is_last_failed()]
+        students.sort(key=lambda x: (not x.forced_tasks, x.last_scrape_start))
+        for student in students:
+            worker = self.worker_of(student.tekbetter_token)
+            with self._lock:
+                if len(worker.in_flight) >= worker.threads:
+                    continue
+                worker.in_flight.add(student.tekbetter_token)
+            student.is_scraping = True
+            student.last_scrape_start = time.time()
+            worker.jobs.put({
+                "type": "scrape",
+                "tekbetter_token": student.tekbetter_token,
+                "token": student.tekbetter_token,
+                "microsoft_session": student.microsoft_session,
+                "intervals": dict(self.main.intervals),
+                "last_scrapes": dict(student.last_scrapes),
+                "forced_tasks": dict(student.forced_tasks),
+                "last_failed_auth": student.last_failed_auth,
+                "adaptive_intervals": dict(student.adaptive_intervals),
+            })
+
+    def run(self):
+        threads = ", ".join(str(worker.threads) for worker in self.workers)
+        log_info(f"Using the process engine ({self.process_count} processes, {threads} threads)")
+        for worker in self.workers:
+            worker.start()
+        self.known_tokens = set(self.main.students_by_token)
+        threading.Thread(target=self.read_results, name="process-results", daemon=True).start()
+        while True:
+            try:
+                self.main.wakeup.wait(1)
+                self.main.wakeup.clear()
+                self.check_workers()
+                self.sync_passage()
+
+                if self.last_config_update + CONFIG_RELOAD_INTERVAL * 60 < time.time():
+                    self.last_config_update = time.time()
+                    load_configuration(self.main)
+                    self.forget_removed_students()
+            except Exception:
+                log_error("An error occured in the process engine loop")
+                log_error(traceback.format_exc())
+                time.sleep(60)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.jobs.put(None)
+        for worker in self.workers:
+            worker.process.join()
+
+    def start(self):
+        try:
+            self.run()
+        except KeyboardInterrupt:
+            log_error("Received keyboard interrupt, exiting.")
+            self.stop()
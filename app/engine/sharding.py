@@ -0,0 +1,146 @@
+import atexit
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+from app.logger import log_info, log_error
+
+
+def rendezvous_owner(token: str, members: list) -> str:
+    """
+    Member owning a student, by rendezvous (highest random weight) hashing: when a member joins or leaves,
+    only the students it takes or gives back change of owner.
+    :param token: TekBetter token of the student
+    :param members: Member ids
+    :return: Member id
+    """
+    return max(members, key=lambda member: hashlib.blake2b(f"{member}:{token}".encode("utf-8"),
+                                                           digest_size=8).digest())
+
+
+class Sharding:
+    """
+    Share the students between several scraper instances, each one scraping the students it owns.
+    - Static: SHARD_COUNT instances, this one being SHARD_INDEX (0 to SHARD_COUNT - 1).
+    - Dynamic: the instances sharing a SHARD_MEMBERSHIP_DIR directory write a heartbeat file in it every
+      SHARD_HEARTBEAT_INTERVAL seconds; an instance without heartbeat for SHARD_MEMBER_TTL seconds
+      is considered gone, and its students are taken by the others.
+    Without any of them, this instance owns every student.
+    """
+
+    def __init__(self):
+        self.directory = os.getenv("SHARD_MEMBERSHIP_DIR")
+        self.heartbeat_interval = float(os.getenv("SHARD_HEARTBEAT_INTERVAL", 10))
+        self.member_ttl = float(os.getenv("SHARD_MEMBER_TTL", 30))
+        self._lock = threading.Lock()
+        self._owned = {}
+        self._invalid_files = set()
+        self._stop = threading.Event()
+
+        if self.directory:
+            self.instance_id = os.getenv("SHARD_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+            self.members = [self.instance_id]
+        elif int(os.getenv("SHARD_COUNT", 1)) > 1:
+            self.instance_id = str(int(os.getenv("SHARD_INDEX", 0)))
+            self.members = [str(i) for i in range(int(os.getenv("SHARD_COUNT")))]
+        else:
+            self.instance_id = None
+            self.members = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.instance_id is not None
+
+    def owns(self, token: str) -> bool:
+        """
+        Tell if this instance scrapes the student of the given TekBetter token
+        """
+        if not self.enabled:
+            return True
+        with self._lock:
+            owned = self._owned.get(token)
+            if owned is None:
+                owned = self._owned[token] = rendezvous_owner(token, self.members) == self.instance_id
+            return owned
+
+    def set_members(self, members: list):
+        members = sorted(set(members) | {self.instance_id})
+        with self._lock:
+            if members == self.members:
+                return
+            self.members = members
+            self._owned = {}
+        log_info(f"[SHARD] {len(members)} instances: {', '.join(members)} (this one: {self.instance_id})")
+
+    def _heartbeat_path(self, instance_id: str) -> str:
+        return os.path.join(self.directory, f"{instance_id}.json")
+
+    def heartbeat(self):
+        """
+        Write the heartbeat of this instance, and read the live members from the heartbeats of the others
+        """
+        path = self._heartbeat_path(self.instance_id)
+        try:
+            with open(f"{path}.tmp", "w") as file:
+                json.dump({"instance": self.instance_id, "heartbeat": time.time()}, file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            log_error(f"[SHARD] Failed to write the heartbeat {path}: {e}")
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            log_error(f"[SHARD] Failed to list the members in {self.directory}, keeping the last ones: {e}")
+            return
+        members = []
+        now = time.time()
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    data = json.load(file)
+                if now - float(data.get("heartbeat", 0)) < self.member_ttl:
+                    members.append(str(data["instance"]))
+            except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+                # Logged once, the file may be foreign to the scraper and stay there
+                if name not in self._invalid_files:
+                    self._invalid_files.add(name)
+                    log_error(f"[SHARD] Ignoring the invalid heartbeat {name}: {e!r}")
+        self.set_members(members)
+
+    def leave(self):
+        """
+        Remove the heartbeat of this instance, so the others take its students without waiting SHARD_MEMBER_TTL
+        """
+        self._stop.set()
+        try:
+            os.remove(self._heartbeat_path(self.instance_id))
+        except OSError:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            # The thread must survive any error: without heartbeat, the other instances take the students
+            # of this one, which would keep scraping them with its last members
+            try:
+                self.heartbeat()
+            except Exception as e:
+                log_error(f"[SHARD] Heartbeat failed: {e!r}")
+
+    def start(self):
+        """
+        Join the membership directory, if SHARD_MEMBERSHIP_DIR is set
+        """
+        if not self.enabled:
+            return
+        if not self.directory:
+            log_info(f"[SHARD] Static shard {self.instance_id} of {len(self.members)}")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.heartbeat()
+        atexit.register(self.leave)
+        threading.Thread(target=self._run, name="shard-heartbeat", daemon=True).start()
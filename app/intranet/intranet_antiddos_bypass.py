@@ -1,10 +1,21 @@
+import os
 import re
 import base64
+import threading
+import time
+
 import requests
 import urllib.parse
-import execjs
+
+try:
+    import execjs
+except ImportError:
+    execjs = None
 
 from app.config import USER_AGENT
+from app.intranet.js_expression import JsExpressionError, evaluate_js_expression
+from app.tools.metrics import ANTIDDOS_SOLVES
+from app.tools.http_pool import get_session
 
 
 def decode_js_content(encoded_str: str) -> str:
@@ -17,6 +28,15 @@ def decode_js_content(encoded_str: str) -> str:
         return f"Erreur lors du décodage : {e}"
 
 
+def evaluate_with_execjs(expression: str):
+    """
+    Evaluate a JavaScript expression with execjs, which spawns the installed JS runtime (Node.js)
+    """
+    if execjs is None:
+        raise Exception("Unsupported anti-ddos puzzle, and execjs is not installed")
+    return execjs.compile(f"const a = () => {expression}").call("a")
+
+
 class IntranetAntiDDoSBypasser:
     def __init__(self):
         self.cookies = {}
@@ -42,7 +62,7 @@ class IntranetAntiDDoSBypasser:
         self.headers = {"User-Agent": USER_AGENT}
 
         # Get the first response, containing the javascript puzzle and the first cookie
-        resp = requests.get("https://intra.epitech.eu/", headers=self.headers)
+        resp = get_session().get("https://intra.epitech.eu/", headers=self.headers)
         self.extract_cookies_from_response(resp)
 
         js_puzzle = None
@@ -81,7 +101,7 @@ class IntranetAntiDDoSBypasser:
 
         # Make the second request
         # We don't know why the data should be "name1=Henry&name2=Ford", but it works.
-        resp = requests.post(
+        resp = get_session().post(
             "https://intra.epitech.eu/",
             headers=self.headers,
             cookies=self.cookies,
@@ -104,8 +124,11 @@ class IntranetAntiDDoSBypasser:
 
         executable_row = row.split("=", 1)[1].replace(";", "").strip()
         variable_name = row.split("=")[0].strip().replace("var ", "")
-        row_js = f"const a = () => {executable_row}"
-        result = execjs.compile(row_js).call("a")
+        try:
+            result = evaluate_js_expression(executable_row)
+        except JsExpressionError:
+            # The puzzle changed: fall back to a real JS runtime
+            result = evaluate_with_execjs(executable_row)
         return variable_name, result
 
     def _extract_all_headers(self, text: str):
@@ -138,4 +161,68 @@ class IntranetAntiDDoSBypasser:
                 name, value = cookie.split("=")
                 self.cookies[name.strip()] = value.strip()
             except Exception:
-                continue  # Ignore malformed rows silently
\ No newline at end of file
+                continue  # Ignore malformed rows silently
+
+
+class AntiDDoSCookieStore:
+    """
+    Anti-DDoS clearance cookies shared by all the students of the process.
+    When the intranet serves its challenge again, only one student solves it: the others wait for that
+    regeneration and reuse its cookies.
+    """
+
+    def __init__(self):
+        self.saved_cookies = {}
+        self.generation = 0
+        self.expires_at = 0
+        self.last_error = None
+        self._regenerating = False
+        self._condition = threading.Condition()
+
+    def get_cookies(self) -> tuple[int, dict]:
+        """
+        Get the current clearance cookies, dropped once older than ANTIDDOS_COOKIE_TTL seconds
+        :return: Generation of the cookies, to give back to regenerate_cookies, and a copy of the cookies
+        """
+        with self._condition:
+            if self.saved_cookies and time.time() > self.expires_at:
+                self.saved_cookies = {}
+            return self.generation, dict(self.saved_cookies)
+
+    def regenerate_cookies(self, seen_generation: int) -> dict:
+        """
+        Invalidate the cookies refused by the intranet and solve the challenge again, unless a regeneration
+        already happened or is in progress since they were read
+        :param seen_generation: Generation of the refused cookies, as returned by get_cookies
+        :return: Copy of the new cookies
+        """
+        with self._condition:
+            while self._regenerating:
+                self._condition.wait()
+            if self.generation != seen_generation:
+                if self.last_error is not None:
+                    raise Exception("Failed to regenerate anti-ddos cookies")
+                return dict(self.saved_cookies)
+            self._regenerating = True
+            self.saved_cookies = {}
+
+        cookies, error = {}, None
+        try:
+            cookies = IntranetAntiDDoSBypasser().regenerate_cookies()
+        except Exception as e:
+            error = e
+
+        with self._condition:
+            self.saved_cookies = cookies
+            self.expires_at = time.time() + int(os.getenv("ANTIDDOS_COOKIE_TTL", 1800))
+            self.generation += 1
+            self.last_error = error
+            self._regenerating = False
+            self._condition.notify_all()
+        ANTIDDOS_SOLVES.inc(result="failure" if error is not None else "success")
+        if error is not None:
+            raise error
+        return dict(cookies)
+
+
+antiddos_cookies = AntiDDoSCookieStore()
@@ -1,10 +1,13 @@
+import itertools
+import json
 import time
 
-import requests
-
 from app.config import INTRANET_LOGIN_URL
 from app.logger import log_info, log_error
 from app.model.Student import Student, TaskType, TaskStatus
+from app.tools.http_pool import get_session
+from app.tools.json_stream import iter_json_array
+from app.tools.metrics import LOGINS
 
 
 class IntranetLoginError(Exception):
@@ -15,30 +18,35 @@ class IntranetNotFoundError(Exception):
     pass
 
 
+# Size of the chunks read from a streamed response
+STREAM_CHUNK_SIZE = 64 * 1024
+
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:86.0) Gecko/20100101 Firefox/86.0"
 }
 
 
-def _build_cookies(cookies: dict, student: Student):
+def _build_cookies(cookies: dict, antiddos_cookies: dict):
     """
     Build the cookies dict for the antiddos page
     :param cookies: List of cookies tuples
+    :param antiddos_cookies: Anti-DDoS clearance cookies, as returned by the cookie store
     :return: dict
     """
-    if cookies is None:
-        cookies = {}
-    cookies_dict = student.antiddos.saved_cookies
-    cookies_dict.update(cookies)
+    cookies_dict = dict(antiddos_cookies)
+    if cookies is not None:
+        cookies_dict.update(cookies)
     return cookies_dict
 
 
-def pass_antiddos(student: Student):
+def pass_antiddos(student: Student, generation: int):
     """
-    Pass the anti-ddos page
+    Pass the anti-ddos page, or wait for another student passing it
+    :param student: Student object
+    :param generation: Generation of the anti-ddos cookies refused by the intranet
     """
     log_info("Trying to pass the anti-ddos page")
-    student.antiddos.regenerate_cookies()
+    student.antiddos.regenerate_cookies(generation)
     log_info("Anti-ddos page passed")
 
 
@@ -55,15 +63,19 @@ class IntranetApi:
         """
         log_info(f"[INTRA] Logging in the intranet of user {student.student_label}")
 
+        generation, antiddos_cookies = student.antiddos.get_cookies()
+        microsoft_session = student.microsoft_session
+
         # Microsoft request
-        msoft_resp = requests.get(
+        msoft_resp = get_session().get(
             INTRANET_LOGIN_URL,
-            cookies=_build_cookies({"ESTSAUTHPERSISTENT": student.microsoft_session}, student),
+            cookies=_build_cookies({"ESTSAUTHPERSISTENT": microsoft_session}, antiddos_cookies),
             headers=DEFAULT_HEADERS,
             allow_redirects=False
         )
 
         if msoft_resp.status_code != 302:
+            LOGINS.inc(service="intra", result="error")
             student.err_scrap("Invalid Microsoft session for the student.")
             student.last_failed_auth = time.time()
             student.send_task_status({TaskType.AUTH: TaskStatus.ERROR})
@@ -71,65 +83,125 @@ class IntranetApi:
 
         # Get the "Location" response header
         location = msoft_resp.headers.get("Location")
-        intra_resp = requests.get(location, headers=DEFAULT_HEADERS, cookies=_build_cookies({}, student),
-                                  allow_redirects=False)
+        intra_resp = get_session().get(location, headers=DEFAULT_HEADERS, cookies=_build_cookies({}, antiddos_cookies),
+                                       allow_redirects=False)
 
         if intra_resp.status_code == 503:  # Anti-ddos page
             if allow_retry:
-                pass_antiddos(student)
+                pass_antiddos(student, generation)
                 return self.login(student, allow_retry=False)
+            LOGINS.inc(service="intra", result="error")
             student.err_scrap("AntiDDoS already passed, but still got a 503 error")
             student.last_failed_auth = time.time()
             raise Exception("AntiDDoS already passed, but still got a 503 error")
 
         if intra_resp.status_code not in [204, 302]:
+            LOGINS.inc(service="intra", result="error")
             student.err_scrap(f"Failed to login to Intranet API for the student: {student.student_label}")
             raise IntranetLoginError(f"Failed to login to Intranet API for the student: {student.student_label}")
 
         # Extract the token from the Set-Cookie header
         set_cookie = intra_resp.headers.get("Set-Cookie", "")
         if "user=" not in set_cookie:
+            LOGINS.inc(service="intra", result="error")
             log_error(f"Failed to login to Intranet API for the student: {student.student_label}")
             raise IntranetLoginError(f"Failed to login to Intranet API for the student: {student.student_label}")
 
         token = set_cookie.split("user=")[1].split(";")[0]
-        student.intra_token = token
+        expires_at = next((c.expires for c in intra_resp.cookies if c.name == "user" and c.expires), None)
+        student.save_token("intra", token, expires_at or time.time() + 3600, microsoft_session)
+        LOGINS.inc(service="intra", result="success")
         student.send_task_status({TaskType.AUTH: TaskStatus.SUCCESS})
         return token
 
-    def api_request(self, url, student_obj: Student, allow_retry=True, timeout=60):
-        if student_obj.intra_token is None:
-            self.login(student_obj)
+    def ensure_login(self, student: Student, expired_token=None):
+        """
+        Log the student in, unless another task of the same student already did it
+        :param student: Student object
+        :param expired_token: Token refused by the intranet, None if the student has no token yet
+        """
+        with student.intra_login_lock:
+            if student.intra_token != expired_token:
+                return
+            if time.time() - student.last_failed_auth < 60:
+                raise IntranetLoginError(f"Intranet login recently failed for the student: {student.student_label}")
+            self.login(student)
+
+    def _get(self, url, student_obj: Student, timeout, stream=False):
+        """
+        Send a request to the intranet with the session of the student, logging in first if needed
+        :return: Response, intranet token and anti-ddos cookies generation used by the request
+        """
+        if student_obj.intra_token is None or student_obj.intra_token_expires < time.time():
+            self.ensure_login(student_obj, expired_token=student_obj.intra_token)
+        token = student_obj.intra_token
+        generation, antiddos_cookies = student_obj.antiddos.get_cookies()
 
-        res = requests.get(
+        res = get_session().get(
             f"https://intra.epitech.eu/{url}",
             headers=DEFAULT_HEADERS,
-            cookies=_build_cookies({"user": student_obj.intra_token}, student_obj),
-            timeout=timeout
+            cookies=_build_cookies({"user": token}, antiddos_cookies),
+            timeout=timeout,
+            stream=stream
         )
+        return res, token, generation
 
-        if res.status_code == 200:
-            content_type = res.headers.get("Content-Type", "")
-            if "application/json" in content_type:
-                return res.json()
-            if content_type == "image/jpeg":
-                # return image bytes
-                return res.content
-            raise Exception("Invalid content type")
-
+    def _prepare_retry(self, res, student_obj: Student, token, generation, allow_retry):
+        """
+        Handle an error answer: pass the anti-ddos page or log in again if a retry is allowed, raise otherwise
+        """
         if res.status_code == 503:
             if allow_retry:
-                pass_antiddos(student_obj)
-                return self.api_request(url, student_obj, allow_retry=False, timeout=timeout)
+                pass_antiddos(student_obj, generation)
+                return
             raise Exception("Failed to pass the anti-ddos page")
 
         if res.status_code == 403:
             if allow_retry:
-                self.login(student_obj)
-                return self.api_request(url, student_obj, allow_retry=False)
+                self.ensure_login(student_obj, expired_token=token)
+                return
             raise IntranetLoginError("Failed to login to Intranet API")
 
         if res.status_code == 404:
             raise IntranetNotFoundError("Resource not found")
 
-        raise Exception(f"Failed to fetch data from Intranet API: {res.status_code}")
\ No newline at end of file
+        raise Exception(f"Failed to fetch data from Intranet API: {res.status_code}")
+
+    def api_request(self, url, student_obj: Student, allow_retry=True, timeout=60):
+        res, token, generation = self._get(url, student_obj, timeout)
+
+        if res.status_code == 200:
+            content_type = res.headers.get("Content-Type", "")
+            if "application/json" in content_type:
+                return res.json()
+            if content_type == "image/jpeg":
+                # return image bytes
+                return res.content
+            raise Exception("Invalid content type")
+
+        self._prepare_retry(res, student_obj, token, generation, allow_retry)
+        return self.api_request(url, student_obj, allow_retry=False, timeout=timeout)
+
+    def api_stream(self, url, student_obj: Student, allow_retry=True, timeout=60):
+        """
+        Same as api_request for an endpoint answering a JSON array, but yield the items of the array while the
+        response is downloaded: the whole array is never held in memory.
+        A response which is not an array is decoded whole, and iterated as api_request's result would be.
+        :return: Generator of the items
+        """
+        res, token, generation = self._get(url, student_obj, timeout, stream=True)
+
+        with res:
+            if res.status_code == 200:
+                if "application/json" not in res.headers.get("Content-Type", ""):
+                    raise Exception("Invalid content type")
+                chunks = res.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+                first = next(chunks, b"")
+                if first.lstrip().startswith(b"["):
+                    yield from iter_json_array(itertools.chain([first], chunks))
+                else:
+                    yield from json.loads(first + b"".join(chunks))
+                return
+
+        self._prepare_retry(res, student_obj, token, generation, allow_retry)
+        yield from self.api_stream(url, student_obj, allow_retry=False, timeout=timeout)
@@ -1,73 +1,127 @@
+import os
 import re
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from app.intranet.intranet_api import IntranetApi
 from app.model.Student import Student
-from app.tools.date_spliter import split_dates
+from app.tools.date_spliter import split_aligned_dates
+from app.tools.ttl_cache import TTLCache
 
 
 class IntranetManager:
     def __init__(self):
         self.api = IntranetApi()
+        self.module_cache = None
+
+    def get_module_cache(self) -> TTLCache:
+        """
+        Cache of the module pages seen by students not registered to the module, shared by all students.
+        Such a page has no student-specific data, so it is the same for every student not registered to the module.
+        """
+        if self.module_cache is None:
+            self.module_cache = TTLCache(int(os.getenv("MODULE_CACHE_SIZE", 2048)),
+                                         int(os.getenv("MODULE_CACHE_TTL", 6 * 3600)))
+        return self.module_cache
 
     def fetch_student(self, student: Student):
         student.log_scrap(f"[INTRA] Fetching student profile")
         return self.api.api_request("user/?format=json", student)
 
-    def fetch_planning(self, student: Student, start_date: datetime, end_date: datetime):
-        student.log_scrap(f"[INTRA] Fetching student planning")
+    def _fetch_windows(self, student: Student, endpoint: str, label: str, start_date: datetime, end_date: datetime,
+                       keep, item_dates) -> list:
+        """
+        Fetch a date range split into windows of INTRANET_WINDOW_DAYS days, INTRANET_WINDOW_WORKERS windows at a time.
+        The windows are aligned on a fixed grid, and the kept items of each one are saved in student.intra_windows:
+        a window which ended more than INTRANET_CLOSED_WINDOW_DAYS days ago almost never changes, so it is only
+        fetched again every INTRANET_CLOSED_WINDOW_TTL seconds. The recent and future windows are always fetched.
+        :param student: Student object
+        :param endpoint: Intranet endpoint, the start and end query parameters are added to it
+        :param label: Name of the fetched data, for the logs
+        :param start_date: Start of the range
+        :param end_date: End of the range
+        :param keep: Function telling if an item of the response should be kept
+        :param item_dates: Function returning the start and end ("%Y-%m-%d %H:%M:%S") of an item
+        :return: Kept items of all windows overlapping the range, in date order
+        """
         start_str = start_date.strftime("%Y-%m-%d")
         end_str = end_date.strftime("%Y-%m-%d")
+        dates = split_aligned_dates(start_str, end_str, int(os.getenv("INTRANET_WINDOW_DAYS", 70)))
+
+        closed_days = int(os.getenv("INTRANET_CLOSED_WINDOW_DAYS", 30))
+        closed_before = (datetime.now() - timedelta(days=closed_days)).strftime("%Y-%m-%d")
+        closed_ttl = int(os.getenv("INTRANET_CLOSED_WINDOW_TTL", 24 * 3600))
+        cached = student.intra_windows.get(endpoint, {})
+        to_fetch = [window for window in dates if window[1] >= closed_before or window not in cached
+                    or time.time() - cached[window][0] >= closed_ttl]
+        if len(to_fetch) < len(dates):
+            student.log_scrap(f"[INTRA] {len(dates) - len(to_fetch)} closed {label} windows found in cache")
+
+        def fetch_window(window):
+            s_start, s_end = window
+            student.log_scrap(f"[INTRA] Fetching student {label} from {s_start} to {s_end}")
+            # Items are filtered while the response is read, the whole window is never decoded at once
+            items = self.api.api_stream(f"{endpoint}start={s_start}&end={s_end}&format=json", student)
+            return time.time(), [item for item in items if keep(item)]
+
+        fetched = {}
+        if to_fetch:
+            max_workers = min(len(to_fetch), int(os.getenv("INTRANET_WINDOW_WORKERS", 4)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                fetched = dict(zip(to_fetch, executor.map(fetch_window, to_fetch)))
+        # Only keep the windows of the current range, the ones which left it are dropped
+        windows = {window: fetched[window] if window in fetched else cached[window] for window in dates}
+        student.intra_windows[endpoint] = windows
+        # The first and last windows follow the grid, and may go beyond the asked range
+        return [item for window in dates for item in windows[window][1]
+                if self._overlaps(item_dates(item), start_str, end_str)]
+
+    @staticmethod
+    def _overlaps(dates: tuple, start: str, end: str) -> bool:
+        """
+        Tell if an item from the start to the end of the dates overlaps the days from start to end.
+        An item without valid dates is kept.
+        """
+        item_start, item_end = dates
+        if not isinstance(item_start, str) or not isinstance(item_end, str):
+            return True
+        return item_start[:10] <= end and item_end[:10] >= start
 
-        final = []
-        dates = split_dates(start_str, end_str, 70)
-
-        for s_start, s_end in dates:
-            student.log_scrap(f"[INTRA] Fetching student planning from {s_start} to {s_end}")
-            res = self.api.api_request(f"planning/load?start={s_start}&end={s_end}&format=json", student)
+    def _keep_planning_event(self, event: dict) -> bool:
+        # Skip personal events
+        if event.get("calendar_type") == "perso":
+            return False
 
-            for event in res:
-                # Skip personal events
-                if event.get("calendar_type") == "perso":
-                    continue
+        # If the student is self-registered, save it.
+        if event.get("event_registered") in ["present", "registered"]:
+            return True
 
-                # If the student is self-registered, save it.
-                if event.get("event_registered") in ["present", "registered"]:
-                    final.append(event)
-                    continue
+        # If it's an appointment, and the student is registered, save it.
+        if event.get("rdv_indiv_registered") is not None:
+            return True
 
-                # If it's an appointment, and the student is registered, save it.
-                if event.get("rdv_indiv_registered") is not None:
-                    final.append(event)
-                    continue
+        # If it's a group appointment, and the student is registered, save it.
+        if event.get("rdv_group_registered") is not None:
+            return True
 
-                # If it's a group appointment, and the student is registered, save it.
-                if event.get("rdv_group_registered") is not None:
-                    final.append(event)
-                    continue
+        # If none of the above applies, skip the event.
+        return False
 
-                # If none of the above applies, skip the event.
-                # final.append(event)  # <- laissé commenté, conforme à ton code source
+    def _keep_project_activity(self, activity: dict) -> bool:
+        return bool(activity.get("registered") and activity.get("type_acti_code") in ["proj", "tp"])
 
-        return final  # Duplicates not expected here; otherwise, use set + hashable key if necessary.
+    def fetch_planning(self, student: Student, start_date: datetime, end_date: datetime):
+        student.log_scrap(f"[INTRA] Fetching student planning")
+        # Duplicates not expected here; otherwise, use set + hashable key if necessary.
+        return self._fetch_windows(student, "planning/load?", "planning", start_date, end_date,
+                                   self._keep_planning_event, lambda event: (event.get("start"), event.get("end")))
 
     def fetch_projects(self, student: Student, start_date: datetime, end_date: datetime):
         student.log_scrap(f"[INTRA] Fetching student projects")
-        start_str = start_date.strftime("%Y-%m-%d")
-        end_str = end_date.strftime("%Y-%m-%d")
-
-        final = []
-        dates = split_dates(start_str, end_str, 70)
-
-        for s_start, s_end in dates:
-            student.log_scrap(f"[INTRA] Fetching student projects from {s_start} to {s_end}")
-            res = self.api.api_request(f"module/board/?start={s_start}&end={s_end}&format=json", student)
-
-            for activity in res:
-                if activity.get("registered") and activity.get("type_acti_code") in ["proj", "tp"]:
-                    final.append(activity)
-
-        return final
+        return self._fetch_windows(student, "module/board/?", "projects", start_date, end_date,
+                                   self._keep_project_activity,
+                                   lambda activity: (activity.get("begin_acti"), activity.get("end_acti")))
 
     def fetch_project_slug(self, ask_json: dict, student: Student):
         scolyear = ask_json["year"]
@@ -104,11 +158,25 @@ class IntranetManager:
                 "id": int(m["id"]) if "id" in m and m["id"] is not None else None,
                 "scolaryear": m["scolaryear"],
                 "codeinstance": m["codeinstance"],
+                "status": m.get("status"),
             }
             for m in res
         ]
 
-    def fetch_module(self, scolar_year: int, code_module: str, code_instance: str, student: Student):
+    def fetch_module(self, scolar_year: int, code_module: str, code_instance: str, student: Student,
+                     registered=True):
+        """
+        Fetch a module page, from the shared cache if the student is not registered to the module
+        :param registered: False if the modules list says the student is not registered to the module
+        :return: Module data, with the TekBetter custom fields
+        """
+        cache_key = (scolar_year, code_module, code_instance)
+        if not registered:
+            cached = self.get_module_cache().get(cache_key)
+            if cached is not None:
+                student.log_scrap(f"[INTRA] Module {code_module} found in cache")
+                return dict(cached)
+
         url = f"module/{scolar_year}/{code_module}/{code_instance}/?format=json"
         student.log_scrap(f"[INTRA] Fetching module {code_module}")
 
@@ -137,4 +205,8 @@ class IntranetManager:
             module_data["tb_roadblock_submodules"] = road_submodules
             module_data["tb_is_roadblock"] = bool(road_submodules and module_data["tb_required_credits"])
 
+        # Only share the pages without registration, grade, credits or activities registrations of a student
+        if str(module_data.get("student_registered")) in ("0", "False"):
+            self.get_module_cache().set(cache_key, dict(module_data))
+
         return module_data
@@ -0,0 +1,182 @@
+import math
+import re
+
+
+class JsExpressionError(Exception):
+    pass
+
+
+_TOKEN_PATTERN = re.compile(r"""\s*(?:(?P<number>\d+(?:\.\d*)?|\.\d+)|(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|(?P<name>[A-Za-z_$][\w$]*)|(?P<op>[-+*/%(),]))""")
+
+
+def _tokenize(text: str) -> list:
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise JsExpressionError(f"Unexpected character at {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1].encode("latin1", "backslashreplace").decode("unicode_escape")
+        tokens.append((kind, value))
+    return tokens
+
+
+def to_js_string(value) -> str:
+    """
+    Convert a value to a string, as JavaScript String(value) does
+    """
+    if isinstance(value, str):
+        return value
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    if float(value).is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _to_number(value) -> float:
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    if not value:
+        return 0
+    try:
+        return int(value, 0) if value.lower().startswith(("0x", "0o", "0b")) else float(value)
+    except ValueError:
+        return math.nan
+
+
+def _normalize(value):
+    # Keep integer results as int, like the values returned by execjs
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 53:
+        return int(value)
+    return value
+
+
+def parse_int(value, radix=None):
+    """
+    JavaScript parseInt(value, radix)
+    """
+    text = to_js_string(value).lstrip()
+    sign = 1
+    if text[:1] in ("-", "+"):
+        sign = -1 if text[0] == "-" else 1
+        text = text[1:]
+    radix = int(_to_number(radix)) if radix is not None and not math.isnan(_to_number(radix)) else 0
+    if radix == 0:
+        radix = 10
+        if text[:2].lower() == "0x":
+            radix, text = 16, text[2:]
+    elif radix == 16 and text[:2].lower() == "0x":
+        text = text[2:]
+    if radix < 2 or radix > 36:
+        return math.nan
+
+    digits = ""
+    for char in text:
+        if not char.isascii() or not char.isalnum() or int(char, 36) >= radix:
+            break
+        digits += char
+    if not digits:
+        return math.nan
+    return sign * int(digits, radix)
+
+
+class _Parser:
+    """
+    Recursive descent evaluator of the JavaScript subset used by the intranet anti-DDoS puzzle:
+    number and string literals, parentheses, + - * / % and parseInt calls.
+    """
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, token = self.peek()
+        if kind is None or (value is not None and token != value):
+            raise JsExpressionError(f"Expected {value or 'a token'}, got {token!r}")
+        self.pos += 1
+        return kind, token
+
+    def parse(self):
+        value = self.expression()
+        if self.pos != len(self.tokens):
+            raise JsExpressionError(f"Unexpected token {self.peek()[1]!r}")
+        return value
+
+    def expression(self):
+        value = self.term()
+        while self.peek()[1] in ("+", "-"):
+            _, op = self.take()
+            right = self.term()
+            if op == "+" and (isinstance(value, str) or isinstance(right, str)):
+                value = to_js_string(value) + to_js_string(right)
+            elif op == "+":
+                value = _normalize(value + right)
+            else:
+                value = _normalize(_to_number(value) - _to_number(right))
+        return value
+
+    def term(self):
+        value = self.unary()
+        while self.peek()[1] in ("*", "/", "%"):
+            _, op = self.take()
+            left, right = _to_number(value), _to_number(self.unary())
+            if op == "*":
+                value = _normalize(left * right)
+            elif right == 0:
+                # JavaScript does not raise on a division by zero
+                value = math.nan if op == "%" or left == 0 or math.isnan(left) else math.copysign(math.inf, left)
+            elif op == "/":
+                value = _normalize(left / right)
+            else:
+                value = _normalize(math.fmod(left, right))
+        return value
+
+    def unary(self):
+        if self.peek()[1] in ("+", "-"):
+            _, op = self.take()
+            value = _to_number(self.unary())
+            return _normalize(-value if op == "-" else value)
+        return self.primary()
+
+    def primary(self):
+        kind, token = self.take()
+        if kind == "number":
+            return _normalize(float(token))
+        if kind == "string":
+            return token
+        if kind == "name" and token == "parseInt":
+            self.take("(")
+            args = [self.expression()]
+            while self.peek()[1] == ",":
+                self.take(",")
+                args.append(self.expression())
+            self.take(")")
+            return _normalize(parse_int(*args[:2]))
+        if token == "(":
+            value = self.expression()
+            self.take(")")
+            return value
+        raise JsExpressionError(f"Unsupported token {token!r}")
+
+
+def evaluate_js_expression(expression: str):
+    """
+    Evaluate a JavaScript expression made of literals, arithmetic and parseInt calls, without any JS runtime
+    :param expression: Example: parseInt("20250108", 10) + parseInt("08012025", 10)
+    :return: Result of the expression (int, float or str)
+    :raise JsExpressionError: if the expression uses something outside the supported subset
+    """
+    return _Parser(_tokenize(expression)).parse()
@@ -1,3 +1,10 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
 
 
@@ -11,19 +18,147 @@ class Colors:
     WHITE = '\033[97m'
     END = '\033[0m'
 
-def print_time():
-    a = datetime.now().strftime("%H:%M:%S")
 
-    print(f"[{a}] ", end="")
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LEVEL_COLORS = {"DEBUG": Colors.CYAN, "INFO": Colors.GREEN, "WARNING": Colors.YELLOW, "ERROR": Colors.RED}
 
-def log_info(message):
-    print_time()
-    print(f'{Colors.GREEN}[INFO]{Colors.END} {message}')
+_queue = None
+_writer = None
+_pending = 0
+_dropped = 0
+_idle = threading.Condition()
+_rings = {}
+_rings_lock = threading.Lock()
 
-def log_warning(message):
-    print_time()
-    print(f'{Colors.YELLOW}[WARNING]{Colors.END} {message}')
 
-def log_error(message):
-    print_time()
-    print(f'{Colors.RED}[ERROR]{Colors.END} {message}')
\ No newline at end of file
+def _format_text(record: tuple) -> str:
+    timestamp, level, message, student, task, duration = record
+    a = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+    prefix = f"[{student}] " if student else ""
+    return f"[{a}] {LEVEL_COLORS[level]}[{level}]{Colors.END} {prefix}{message}"
+
+
+def _format_json(record: tuple) -> str:
+    timestamp, level, message, student, task, duration = record
+    line = {"time": datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"), "level": level,
+            "message": message}
+    if student:
+        line["student"] = student
+    if task:
+        line["task"] = task
+    if duration is not None:
+        line["duration"] = round(duration, 3)
+    return json.dumps(line, ensure_ascii=False)
+
+
+def _write_loop():
+    global _pending
+    formatter = _format_json if os.getenv("LOG_FORMAT", "text").lower() == "json" else _format_text
+    reported = 0
+    while True:
+        with _idle:
+            while not _queue:
+                _idle.wait()
+            record = _queue.popleft()
+            dropped = _dropped
+        if dropped > reported:
+            drop_record = (time.time(), "WARNING", f"Log queue is full, {dropped} lines dropped so far", None, None, None)
+            sys.stdout.write(formatter(drop_record) + "\n")
+            reported = dropped
+        sys.stdout.write(formatter(record) + "\n")
+        with _idle:
+            _pending -= 1
+            if _pending == 0:
+                sys.stdout.flush()
+                _idle.notify_all()
+
+
+def _start_writer():
+    """
+    Create the queue and start the logger thread. Called with _idle held.
+    """
+    global _queue, _writer
+    _queue = deque(maxlen=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    _writer = threading.Thread(target=_write_loop, name="logger", daemon=True)
+    _writer.start()
+
+
+def get_dropped_logs() -> int:
+    """
+    Number of lines dropped because the queue was full (stdout slower than the logged lines)
+    """
+    return _dropped
+
+
+def is_enabled(level: str) -> bool:
+    return LEVELS[level] >= LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), 20)
+
+
+def log(level: str, message, student=None, task=None, duration=None):
+    """
+    Queue a log line, written by the logger thread: the calling thread never waits on stdout.
+    Lines of a disabled level (LOG_LEVEL) are dropped before any formatting. The queue keeps at most LOG_QUEUE_SIZE
+    lines: if stdout stalls, the oldest are dropped.
+    :param level: DEBUG, INFO, WARNING or ERROR
+    :param message: Message to log
+    :param student: Student label, the line is also kept in the recent lines of the student
+    :param task: Task type the line is about
+    :param duration: Duration in seconds the line is about
+    """
+    global _pending, _dropped
+    if not is_enabled(level):
+        return
+    record = (time.time(), level, str(message), student, task, duration)
+    if student:
+        with _rings_lock:
+            ring = _rings.get(student)
+            if ring is None:
+                ring = _rings[student] = deque(maxlen=int(os.getenv("LOG_RING_SIZE", 200)))
+            ring.append(record)
+    with _idle:
+        if _writer is None:
+            _start_writer()
+        if len(_queue) == _queue.maxlen:
+            _dropped += 1
+        else:
+            _pending += 1
+        _queue.append(record)
+        _idle.notify_all()
+
+
+def get_recent_logs(student: str) -> list:
+    """
+    Get the last LOG_RING_SIZE lines logged for a student, as JSON-serializable dicts
+    """
+    with _rings_lock:
+        records = list(_rings.get(student, []))
+    return [json.loads(_format_json(record)) for record in records]
+
+
+def flush_logs(timeout: float = 5):
+    """
+    Wait until all the queued lines are written
+    """
+    deadline = time.time() + timeout
+    with _idle:
+        while _pending > 0 and time.time() < deadline:
+            _idle.wait(timeout=max(0.0, deadline - time.time()))
+
+
+atexit.register(flush_logs)
+
+
+def log_debug(message, **fields):
+    log("DEBUG", message, **fields)
+
+
+def log_info(message, **fields):
+    log("INFO", message, **fields)
+
+
+def log_warning(message, **fields):
+    log("WARNING", message, **fields)
+
+
+def log_error(message, **fields):
+    log("ERROR", message, **fields)
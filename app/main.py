@@ -3,11 +3,16 @@ import threading
 import time
 import traceback
 from datetime import datetime, timedelta
+from app.config import CONFIG_RELOAD_INTERVAL
+from app.engine.process_pool import ProcessEngine
+from app.engine.sharding import Sharding
 from app.intranet.intranet_manager import IntranetManager
 from app.logger import log_info, log_error, log_warning
 from app.myepitech.myepitech_manager import MyEpitechManager
+from app.server_api import ServerApi
 from app.tools.config_loader import load_configuration
 from app.tools.env_loader import check_env_variables
+from app.tools.status_sender import status_sender
 from app.model.Student import Student, TaskStatus, TaskType
 
 
@@ -15,7 +20,11 @@ class Main:
     def __init__(self):
         log_info("Welcome to the TekBetter scraper")
         self.students = []
+        self.students_by_token = {}
+        self.config_etag = None
+        self.sharding = Sharding()
         self.threads = []
+        self.wakeup = threading.Event()
         self.myepitech = MyEpitechManager()
         self.intranet = IntranetManager()
         self.intervals = {
@@ -32,18 +41,43 @@ class Main:
         for student in self.students:
             student.main = self
 
+        self.sharding.start()
+
+        self.server_api = ServerApi(self)
+        self.server_api.start()
+
+    def get_student(self, tekbetter_token: str):
+        return self.students_by_token.get(tekbetter_token)
+
+    def trigger_scrape(self, student: Student, tasks: list) -> list:
+        """
+        Scrape the given tasks of a student as soon as possible, ignoring their intervals
+        :param student: Student object
+        :param tasks: Task types to scrape
+        :return: Task types newly queued, the others were already waiting for a scrape
+        """
+        queued = student.force_tasks(tasks)
+        self.wakeup.set()
+        return queued
+
+    def owned_students(self) -> list:
+        """
+        Students scraped by this instance, all of them unless sharding is enabled
+        """
+        return [s for s in self.students if s is not None and self.sharding.owns(s.tekbetter_token)]
+
     def clean_threads(self):
         for thread in self.threads:
            if not thread.is_alive():
                self.threads.remove(thread)
     def sync_passage(self):
         self.clean_threads()
-        students = [s for s in self.students if s is not None]
+        students = self.owned_students()
         # Remove student who is currently scraping
         scraping_count = len([s for s in students if s.is_scraping])
         students = [s for s in students if not s.is_scraping and s.one_need_scrape() and not s.is_last_failed()]
-        # sort by student.get_last_scrape() to get olders first
-        students.sort(key=lambda x: x.last_scrape_start)
+        # sort by student.get_last_scrape() to get olders first, students with triggered tasks before the others
+        students.sort(key=lambda x: (not x.forced_tasks, x.last_scrape_start))
         max_threads = int(os.getenv("MAX_THREADS", 10))
         to_scrape_count = max_threads - scraping_count
         if to_scrape_count <= 0:
@@ -58,25 +92,29 @@ class Main:
 if __name__ == "__main__":
     main = Main()
     last_config_update = datetime.now()
-    CONFIG_RELOAD_INTERVAL = 2
+
+    if os.getenv("SCRAPER_ENGINE") == "process":
+        ProcessEngine(main).start()
+        exit(0)
 
     try:
         while True:
             try:
-                time.sleep(1)
+                main.wakeup.wait(1)
+                main.wakeup.clear()
                 main.sync_passage()
 
                 if last_config_update + timedelta(minutes=CONFIG_RELOAD_INTERVAL) < datetime.now():
                     last_config_update = datetime.now()
                     load_configuration(main)
-            except Exception as e:
+            except Exception:
                 log_error("An error occured in the main loop")
-                log_error(str(e))
-                traceback.print_exc()
+                log_error(traceback.format_exc())
                 time.sleep(60)
                 continue
     except KeyboardInterrupt:
         log_error("Received keyboard interrupt, exiting.")
         for t in main.threads:
             t.join()
+        status_sender.flush()
         exit(0)
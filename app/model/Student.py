@@ -1,12 +1,18 @@
 import base64
 import os
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-import requests
-
 from app.logger import log_error, log_info
+from app.tools.compression import describe_encoding, encode_json_body
+from app.tools.delta import section_hash
+from app.tools.http_pool import get_session
+from app.tools.metrics import SCHEDULING_LAG, TASK_DURATION
+from app.tools.status_sender import status_sender
+from app.tools.token_store import get_token_store
 
 
 class TaskStatus:
@@ -27,12 +33,25 @@ class TaskType:
     SCRAPING = "scraping"
 
 
+# Sections only pushed when their content changed since the last successful push
+DELTA_SECTIONS = [TaskType.PROFILE, TaskType.PLANNING, TaskType.PROJECTS]
+
+# Tasks whose interval grows while they bring no new data, with ADAPTIVE_INTERVALS
+ADAPTIVE_TASKS = [TaskType.MOULI, TaskType.MODULES] + DELTA_SECTIONS
+
+
+def adaptive_intervals_enabled() -> bool:
+    return os.getenv("ADAPTIVE_INTERVALS", "").lower() in ("1", "true", "yes")
+
+
 class Student:
     def __init__(self):
         self.microsoft_session = ""
         self.tekbetter_token = None
         self.myepitech_token = None
+        self.myepitech_token_expires = 0
         self.intra_token = None
+        self.intra_token_expires = 0
         self.last_sync = 0
         self.student_label = None
         self.antiddos = None
@@ -41,26 +60,69 @@ class Student:
         self.last_scrape_start = 0
         self.is_scraping = False
         self.last_failed_auth = 0
+        self.intra_login_lock = threading.Lock()
+        self.myepitech_login_lock = threading.Lock()
+        self.pushed_hashes = {}
+        self.push_count = 0
+        self.mouli_years = {}
+        self.intra_windows = {}
+        self.forced_tasks = {}
+        self.adaptive_intervals = {}
+        # Tasks failed during the current scrape, whose result may still be partial (modules)
+        self.failed_tasks = set()
 
     def send_task_status(self, status: dict[str, str]):
-        try:
-            api_url = os.getenv("TEKBETTER_API_URL")
-            body = {key: value for key, value in status.items()}
-            requests.post(
-                f"{api_url}/api/scraper/status",
-                json=body,
-                headers={"Authorization": f"Bearer {self.tekbetter_token}"},
-                timeout=10
-            )
-        except Exception as e:
-            log_error(f"Failed to send task status for student: {self.student_label}")
-            log_error(str(e))
+        status_sender.send(self.tekbetter_token, self.student_label, status)
+
+    def restore_tokens(self):
+        """
+        Restore the MyEpitech and intranet tokens saved in the token store, if they are still valid
+        """
+        store = get_token_store()
+        if store is None:
+            return
+        self.myepitech_token, self.myepitech_token_expires = store.load(self.tekbetter_token, "myepitech")
+        self.intra_token, self.intra_token_expires = store.load(self.tekbetter_token, "intra")
+        if self.myepitech_token or self.intra_token:
+            self.log_scrap("Restored tokens from the token store.")
+
+    def save_token(self, service: str, token: str, expires_at: float, microsoft_session: str = None):
+        """
+        Save a new MyEpitech ("myepitech") or intranet ("intra") token of the student
+        :param microsoft_session: Microsoft session used by the login, the token is dropped if it changed since
+        :return: True if the token was saved
+        """
+        if microsoft_session is not None and microsoft_session != self.microsoft_session:
+            self.log_scrap(f"Microsoft session changed during the {service} login, token dropped.")
+            return False
+        if service == "myepitech":
+            self.myepitech_token, self.myepitech_token_expires = token, expires_at
+        else:
+            self.intra_token, self.intra_token_expires = token, expires_at
+        store = get_token_store()
+        if store is not None:
+            store.save(self.tekbetter_token, service, token, expires_at)
+        return True
+
+    def reset_tokens(self):
+        """
+        Forget the MyEpitech and intranet tokens of the student, after its Microsoft session changed.
+        Doesn't wait for the logins in progress (called by the scheduling loop): their token, of the previous
+        session, is dropped by save_token.
+        """
+        self.myepitech_token, self.myepitech_token_expires = None, 0
+        self.intra_token, self.intra_token_expires = None, 0
+        self.last_failed_auth = 0
+        store = get_token_store()
+        if store is not None:
+            store.delete(self.tekbetter_token, "myepitech")
+            store.delete(self.tekbetter_token, "intra")
 
-    def log_scrap(self, message):
-        log_info(f"[{self.student_label}] {message}")
+    def log_scrap(self, message, **fields):
+        log_info(message, student=self.student_label, **fields)
 
-    def err_scrap(self, message):
-        log_error(f"[{self.student_label}] {message}")
+    def err_scrap(self, message, **fields):
+        log_error(message, student=self.student_label, **fields)
 
     def is_last_failed(self):
         return time.time() - self.last_failed_auth < 60 * 5
@@ -72,11 +134,14 @@ class Student:
                 return
 
             self.is_scraping = True
+            due_since = self.due_since()
+            if due_since is not None:
+                SCHEDULING_LAG.observe(max(0.0, self.last_scrape_start - due_since))
             self.log_scrap("Scraping started.")
             api_url = os.getenv("TEKBETTER_API_URL")
 
             try:
-                res = requests.get(
+                res = get_session().get(
                     f"{api_url}/api/scraper/infos",
                     headers={"Authorization": f"Bearer {self.tekbetter_token}"},
                     timeout=10
@@ -109,42 +174,48 @@ class Student:
             start_date = datetime.strptime(res_json.get("fetch_start"), "%Y-%m-%d") if res_json.get("fetch_start") else (datetime.now() - timedelta(days=5 * 365))
             end_date = datetime.strptime(res_json.get("fetch_end"), "%Y-%m-%d") if res_json.get("fetch_end") else (datetime.now() + timedelta(days=365))
 
+            tasks = {}
             if self.can_scrape(TaskType.MOULI):
-                start = time.time()
-                out_data[TaskType.MOULI] = self.scrape_moulinettes(known_tests)
-                self.log_scrap(f"Mouli scraped in {time.time() - start:.2f}s")
+                tasks[TaskType.MOULI] = lambda: self.scrape_moulinettes(known_tests)
 
             if time.time() - self.last_failed_auth > 60:
                 if self.can_scrape(TaskType.MODULES):
-                    start = time.time()
-                    out_data[TaskType.MODULES] = self.scrape_modules(known_modules)
-                    self.log_scrap(f"Modules scraped in {time.time() - start:.2f}s")
+                    tasks[TaskType.MODULES] = lambda: self.scrape_modules(known_modules)
 
                 if self.can_scrape(TaskType.PROFILE):
-                    out_data[TaskType.PROFILE] = self.scrape_intra_profile()
+                    tasks[TaskType.PROFILE] = self.scrape_intra_profile
 
                 if self.can_scrape(TaskType.PLANNING):
-                    out_data[TaskType.PLANNING] = self.scrape_intra_planning(start_date, end_date)
+                    tasks[TaskType.PLANNING] = lambda: self.scrape_intra_planning(start_date, end_date)
 
                 if self.can_scrape(TaskType.PROJECTS):
-                    out_data[TaskType.PROJECTS] = self.scrape_intra_projects(start_date, end_date)
+                    tasks[TaskType.PROJECTS] = lambda: self.scrape_intra_projects(start_date, end_date)
 
                 if need_picture:
-                    out_data[TaskType.PICTURE] = self.scrape_intra_picture(need_picture)
+                    tasks[TaskType.PICTURE] = lambda: self.scrape_intra_picture(need_picture)
 
                 if asked_slugs:
-                    out_data[TaskType.SLUGS] = self.scrape_slugs(asked_slugs)
+                    tasks[TaskType.SLUGS] = lambda: self.scrape_slugs(asked_slugs)
+
+            self.failed_tasks = set()
+            out_data.update(self.run_tasks(tasks))
 
             self.log_scrap("Pushing scraped data...")
             try:
-                res = requests.post(
+                push_data, hashes = self.build_push_data(out_data)
+                self.adapt_intervals(out_data, hashes)
+                body, headers, stats = encode_json_body(push_data)
+                self.log_scrap(f"Push body: {describe_encoding(stats)}")
+                res = get_session().post(
                     f"{api_url}/api/scraper/push",
-                    json=out_data,
-                    headers={"Authorization": f"Bearer {self.tekbetter_token}"},
+                    data=body,
+                    headers={"Authorization": f"Bearer {self.tekbetter_token}", **headers},
                     timeout=10
                 )
                 if res.status_code != 200:
                     raise Exception("Push failed")
+                self.pushed_hashes.update(hashes)
+                self.push_count += 1
 
                 self.send_task_status({TaskType.SCRAPING: TaskStatus.SUCCESS})
                 self.log_scrap("Data pushed successfully.")
@@ -152,19 +223,129 @@ class Student:
                 self.err_scrap("Failed to push scraped data.")
                 self.send_task_status({TaskType.SCRAPING: TaskStatus.ERROR})
         except Exception as e:
-            traceback.print_exc()
-            self.err_scrap("Scraping process failed.")
+            self.err_scrap(f"Scraping process failed.\n{traceback.format_exc()}")
         finally:
             self.is_scraping = False
 
+    def build_push_data(self, out_data: dict):
+        """
+        Replace the sections unchanged since the last successful push by None, as for a section not scraped.
+        Every PUSH_FULL_RESYNC_CYCLES pushes, all the sections are sent again.
+        :param out_data: Scraped data
+        :return: Data to push, and the hashes of the pushed sections
+        """
+        push_data = dict(out_data)
+        hashes = {}
+        full_resync = self.push_count % max(1, int(os.getenv("PUSH_FULL_RESYNC_CYCLES", 10))) == 0
+        unchanged = []
+        for section in DELTA_SECTIONS:
+            if out_data.get(section) is None:
+                continue
+            hashes[section] = section_hash(out_data[section])
+            if not full_resync and self.pushed_hashes.get(section) == hashes[section]:
+                push_data[section] = None
+                unchanged.append(section)
+        if unchanged:
+            self.log_scrap(f"Unchanged since last push, not sent: {', '.join(unchanged)}")
+        return push_data, hashes
+
+    def adapt_intervals(self, out_data: dict, hashes: dict):
+        """
+        With ADAPTIVE_INTERVALS, double the interval of the tasks which brought no new data, up to
+        ADAPTIVE_MAX_INTERVAL seconds, and reset the interval of the tasks which did to the configured one.
+        New data is a new moulinette test or module, or a profile, planning or projects hash other than the pushed one.
+        The tasks not scraped, or failed, keep their interval.
+        :param out_data: Scraped data
+        :param hashes: Hashes of the scraped sections, from build_push_data
+        """
+        if not adaptive_intervals_enabled():
+            return
+        changes = {section: self.pushed_hashes.get(section) != section_hash for section, section_hash in hashes.items()}
+        for task_type in [TaskType.MOULI, TaskType.MODULES]:
+            # A failed modules scrape still returns the modules fetched before the error, maybe none
+            if out_data.get(task_type) is not None and task_type not in self.failed_tasks:
+                changes[task_type] = len(out_data[task_type]) > 0
+
+        max_interval = int(os.getenv("ADAPTIVE_MAX_INTERVAL", 1800))
+        for task_type, changed in changes.items():
+            if task_type not in self.main.intervals:
+                continue
+            base = self.main.intervals[task_type]
+            current = self.interval(task_type)
+            interval = base if changed else min(max(base, max_interval), current * 2)
+            if interval == current:
+                continue
+            if interval == base:
+                self.adaptive_intervals.pop(task_type, None)
+                self.log_scrap(f"{task_type.capitalize()} changed, interval back to {interval}s")
+            else:
+                self.adaptive_intervals[task_type] = interval
+                self.log_scrap(f"{task_type.capitalize()} unchanged, interval raised to {interval}s")
+
+    def run_tasks(self, tasks: dict) -> dict:
+        """
+        Run the given scraping tasks in parallel, at most STUDENT_MAX_TASKS at a time.
+        The MyEpitech and intranet tasks share nothing, so the scrape lasts as long as the slowest task.
+        :param tasks: Dict of task type -> function returning the task result
+        :return: Dict of task type -> task result
+        """
+        if not tasks:
+            return {}
+
+        def timed(task_type, task):
+            start = time.time()
+            result = task()
+            duration = time.time() - start
+            TASK_DURATION.observe(duration, task=task_type)
+            self.log_scrap(f"{task_type.capitalize()} scraped in {duration:.2f}s", task=task_type, duration=duration)
+            return result
+
+        max_workers = min(len(tasks), int(os.getenv("STUDENT_MAX_TASKS", 4)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {key: executor.submit(timed, key, task) for key, task in tasks.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+    def force_tasks(self, tasks: list) -> list:
+        """
+        Make the given tasks due now, whatever their interval. Triggers of a task already waiting are merged.
+        :param tasks: Task types to scrape
+        :return: Task types newly forced
+        """
+        queued = [t for t in tasks if t not in self.forced_tasks]
+        now = time.time()
+        for task_type in queued:
+            self.forced_tasks[task_type] = now
+        return queued
+
     def save_scrape(self, key):
         self.last_scrapes[key] = time.time()
+        # A trigger received after the start of this scrape still needs a new scrape
+        triggered_at = self.forced_tasks.get(key)
+        if triggered_at is not None and triggered_at <= self.last_scrape_start:
+            self.forced_tasks.pop(key, None)
+
+    def interval(self, task_type: str):
+        """
+        Interval of a task for this student: the configured one, or longer while the task brings no new data
+        """
+        base = self.main.intervals[task_type]
+        return max(base, self.adaptive_intervals.get(task_type, base))
 
     def can_scrape(self, task_type: str):
         if task_type not in self.main.intervals:
             return False
+        if task_type in self.forced_tasks:
+            return True
         last = self.last_scrapes.get(task_type, 0)
-        return (time.time() - last) > self.main.intervals[task_type]
+        return (time.time() - last) > self.interval(task_type)
+
+    def due_since(self):
+        """
+        Time at which the student became due for a scrape, None if none of the due tasks was ever scraped
+        """
+        dues = [self.last_scrapes[t] + self.interval(t) for t in self.main.intervals
+                if t in self.last_scrapes and self.can_scrape(t)]
+        return min(dues) if dues else None
 
     def one_need_scrape(self):
         return any(self.can_scrape(t) for t in [
@@ -206,11 +387,13 @@ class Student:
             all_modules = self.main.intranet.fetch_modules_list(self)
             for module in all_modules:
                 if module["id"] not in known_modules:
-                    m = self.main.intranet.fetch_module(module["scolaryear"], module["code"], module["codeinstance"], self)
+                    m = self.main.intranet.fetch_module(module["scolaryear"], module["code"], module["codeinstance"], self,
+                                                        registered=module.get("status") != "notregistered")
                     m["id"] = module.get("id")
                     results.append(m)
             self.send_task_status({TaskType.MODULES: TaskStatus.SUCCESS})
         except Exception:
+            self.failed_tasks.add(TaskType.MODULES)
             self.send_task_status({TaskType.MODULES: TaskStatus.ERROR})
             self.err_scrap("Failed to fetch modules.")
         self.save_scrape(TaskType.MODULES)
@@ -1,7 +1,10 @@
-import requests
+import time
 
 from app.config import MYEPITECH_LOGIN_URL
 from app.model.Student import Student, TaskStatus, TaskType
+from app.tools.http_pool import get_session
+from app.tools.metrics import LOGINS
+from app.tools.token_store import decode_jwt_expiry
 
 
 class MyEpitechLoginError(Exception):
@@ -25,34 +28,49 @@ class MyEpitechApi:
         :param student: Student object
         :return: string token if the session is created
         """
-        request = requests.get(MYEPITECH_LOGIN_URL, cookies={
-            "ESTSAUTHPERSISTENT": student.microsoft_session
+        microsoft_session = student.microsoft_session
+        request = get_session().get(MYEPITECH_LOGIN_URL, cookies={
+            "ESTSAUTHPERSISTENT": microsoft_session
         })
         if request.status_code != 200:
+            LOGINS.inc(service="myepitech", result="error")
             student.send_task_status({TaskType.AUTH: TaskStatus.ERROR})
             raise Exception("Failed to create myepitech session")
         # Get the "Location" response header
         location = request.url
         # Extract the token from the location
         if not "id_token=" in location:
+            LOGINS.inc(service="myepitech", result="error")
             student.send_task_status({TaskType.MOULI: TaskStatus.ERROR})
             raise MyEpitechLoginError("Failed to login to MyEpitech API")
         token = location.split("id_token=")[1].split("&")[0]
-        student.myepitech_token = token
+        student.save_token("myepitech", token, decode_jwt_expiry(token) or time.time() + 3600, microsoft_session)
+        LOGINS.inc(service="myepitech", result="success")
         student.send_task_status({TaskType.AUTH: TaskStatus.SUCCESS})
         return token
 
+    def ensure_login(self, student: Student, expired_token=None):
+        """
+        Log the student in, unless another task of the same student already did it
+        :param student: Student object
+        :param expired_token: Token refused by the API, None if the student has no token yet
+        """
+        with student.myepitech_login_lock:
+            if student.myepitech_token == expired_token:
+                self.login(student)
+
     def api_request(self, url, student_obj: Student, allow_retry=True):
-        if student_obj.myepitech_token is None:
-            self.login(student_obj)
-        res = requests.get(f"https://api.epitest.eu/{url}",
-                           headers={"Authorization": f"Bearer {student_obj.myepitech_token}", "Content-Type": "application/json"})
+        if student_obj.myepitech_token is None or student_obj.myepitech_token_expires < time.time():
+            self.ensure_login(student_obj, expired_token=student_obj.myepitech_token)
+        token = student_obj.myepitech_token
+        res = get_session().get(f"https://api.epitest.eu/{url}",
+                                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"})
         if res.status_code == 200:
             return res.json()
 
         if res.status_code == 403:
             if allow_retry:
-                self.login(student_obj)
+                self.ensure_login(student_obj, expired_token=token)
                 return self.api_request(url, student_obj, allow_retry=False)
             raise MyEpitechLoginError("Failed to login to MyEpitech API")
 
@@ -1,6 +1,10 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from app.model.Student import Student
 from app.myepitech.myepitech_api import MyEpitechApi
+from app.tools.ttl_cache import TTLCache
 
 
 class LatestTest:
@@ -13,22 +17,52 @@ class LatestTest:
 class MyEpitechManager:
     def __init__(self):
         self.api = MyEpitechApi()
+        self.details_cache = None
 
+    def get_details_cache(self) -> TTLCache:
+        """
+        Cache of the test details, shared by all students: teammates get the same test runs.
+        A student only reads the runs listed in its own projects, so it never sees a test it can't access.
+        """
+        if self.details_cache is None:
+            self.details_cache = TTLCache(int(os.getenv("MYEPITECH_DETAILS_CACHE_SIZE", 4096)),
+                                          int(os.getenv("MYEPITECH_DETAILS_CACHE_TTL", 24 * 3600)))
+        return self.details_cache
 
     def fetch_student(self, student: Student, known_tests: [int]):
         student.log_scrap("[MYEPITECH] Fetching student moulinettes")
         current_year = datetime.now().year
         years = [current_year - 3, current_year - 2, current_year -1, current_year]
-        new_tests = {}
-        for year in years:
-            all_projects = self.get_latest_from_year(student, year)
-            new_projects = [p for p in all_projects if int(p.last_id) not in known_tests]
-            for nproj in new_projects:
-                history = self.get_project_history(student, nproj.year, nproj.project_slug, nproj.project_module)
-                data = self.get_data_from_list(student=student, tests_obs=history, known_tests=known_tests)
-                for key, value in data.items():
-                    new_tests[key] = value
-        return new_tests
+
+        with ThreadPoolExecutor(max_workers=int(os.getenv("MYEPITECH_WORKERS", 4))) as executor:
+            years_projects = executor.map(lambda year: self.get_year_projects(student, year), years)
+            new_projects = [p for projects in years_projects for p in projects if int(p.last_id) not in known_tests]
+
+            histories = executor.map(
+                lambda nproj: self.get_project_history(student, nproj.year, nproj.project_slug, nproj.project_module),
+                new_projects
+            )
+            tests = [test for history in histories for test in history]
+            return self.get_data_from_list(student=student, tests_obs=tests, known_tests=known_tests,
+                                           executor=executor)
+
+    def get_year_projects(self, student: Student, year: int):
+        """
+        Get the latest tests of a year. The years before the current academic year are closed and almost never
+        change, so they are only fetched again every MYEPITECH_CLOSED_YEAR_TTL seconds
+        (or when student.mouli_years is cleared).
+        """
+        now = datetime.now()
+        academic_year = now.year if now.month >= 9 else now.year - 1
+        if year >= academic_year:
+            return self.get_latest_from_year(student, year)
+
+        cached = student.mouli_years.get(year)
+        if cached is not None and time.time() - cached[0] < int(os.getenv("MYEPITECH_CLOSED_YEAR_TTL", 24 * 3600)):
+            return cached[1]
+        projects = self.get_latest_from_year(student, year)
+        student.mouli_years[year] = (time.time(), projects)
+        return projects
 
     def _is_valid_project(self, project):
         if "project" not in project:
@@ -45,22 +79,24 @@ class MyEpitechManager:
             return False
         return True
 
-    def get_data_from_list(self, student: Student, tests_obs: [LatestTest], known_tests: [int], force_fetch=False):
+    def get_data_from_list(self, student: Student, tests_obs: [LatestTest], known_tests: [int], force_fetch=False,
+                           executor=None):
         """
         Fetch data from a list of tests
         :param student:  Student object
         :param tests_obs:  List of LatestTest objects
         :param known_tests:  List of known tests
         :param force_fetch:
+        :param executor: Executor used to fetch the tests in parallel, None to fetch them one by one
         :return:  Dict of test data (test_id: data)
         """
-        tests_data = {}
+        to_fetch = {}
         for test in tests_obs:
             if str(test.last_id) in known_tests and not force_fetch:
                 continue
-            data = self.get_test_data(student, test)
-            tests_data[test.last_id] = data
-        return tests_data
+            to_fetch.setdefault(test.last_id, test)
+        fetch = executor.map if executor is not None else map
+        return dict(zip(to_fetch.keys(), fetch(lambda t: self.get_test_data(student, t), to_fetch.values())))
 
     def get_latest_from_year(self, student_obj, year: int):
         obj_tests = []
@@ -96,6 +132,8 @@ class MyEpitechManager:
         return obj_tests
 
     def get_test_data(self, student, test: LatestTest):
-        student.log_scrap(f"Fetching data for test n°{test.last_id} ({test.project_slug}/{test.project_module}/{test.year})")
-        test_data = self.api.api_request(f"me/details/{test.last_id}", student)
-        return test_data
+        def load():
+            student.log_scrap(f"Fetching data for test n°{test.last_id} ({test.project_slug}/{test.project_module}/{test.year})")
+            return self.api.api_request(f"me/details/{test.last_id}", student)
+
+        return self.get_details_cache().get_or_load(int(test.last_id), load)
@@ -0,0 +1,160 @@
+import hmac
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from app.logger import get_dropped_logs, get_recent_logs, log_info, log_error
+from app.model.Student import ADAPTIVE_TASKS
+from app.tools.metrics import Gauge, registry
+from app.tools.rate_limiter import get_limiters
+from app.tools.status_sender import status_sender
+
+
+def json_response(status: int, data: dict):
+    return status, "application/json", json.dumps(data).encode("utf-8")
+
+
+class ServerApi:
+    """
+    Embedded HTTP server of the scraper, started when SERVER_API_PORT is set.
+    Routes:
+    - GET /metrics: Prometheus metrics
+    - POST /scrape: Scrape some tasks of a student now, called by the TekBetter backend.
+      Body: {"tekbetter_token": "...", "tasks": ["mouli", ...]}, all the tasks if "tasks" is missing.
+      Answers 421 if the student is scraped by another shard.
+      Authenticated with "Authorization: Bearer <SERVER_API_TOKEN>" (PUBLIC_SCRAPER_TOKEN if not set)
+    - GET /logs?student=<label>: Last log lines of a student, same authentication as /scrape
+    """
+
+    def __init__(self, main):
+        self.main = main
+        self.server = None
+        self.routes = {
+            ("GET", "/metrics"): self.get_metrics,
+            ("POST", "/scrape"): self.post_scrape,
+            ("GET", "/logs"): self.get_logs,
+        }
+
+        registry.register(Gauge(
+            "tekbetter_scrapes_active", "Students being scraped",
+            callback=lambda: {(): len([s for s in self.main.students if s.is_scraping])}))
+        registry.register(Gauge(
+            "tekbetter_scrapes_queued", "Students due for a scrape, waiting for a free worker",
+            callback=lambda: {(): len([s for s in self.main.owned_students()
+                                       if not s.is_scraping and not s.is_last_failed() and s.one_need_scrape()])}))
+        registry.register(Gauge(
+            "tekbetter_students", "Students loaded from the configuration",
+            callback=lambda: {(): len(self.main.students)}))
+        registry.register(Gauge(
+            "tekbetter_students_owned", "Students scraped by this instance, out of the sharded students",
+            callback=lambda: {(): len(self.main.owned_students())}))
+        registry.register(Gauge(
+            "tekbetter_shard_members", "Scraper instances sharing the students",
+            callback=lambda: {(): max(1, len(self.main.sharding.members))}))
+        registry.register(Gauge(
+            "tekbetter_students_slowed_down", "Students scraped less often because a task brings no new data",
+            ["task"], callback=lambda: {(t,): len([s for s in self.main.owned_students() if t in s.adaptive_intervals])
+                                        for t in ADAPTIVE_TASKS}))
+        registry.register(Gauge(
+            "tekbetter_rate_limit_concurrency", "Current concurrency limit of the upstream hosts", ["host"],
+            callback=lambda: {(l.host,): l.stats()["limit"] for l in get_limiters() if l.adaptive}))
+        registry.register(Gauge(
+            "tekbetter_rate_limit_in_flight", "Requests in flight to the upstream hosts", ["host"],
+            callback=lambda: {(l.host,): l.stats()["in_flight"] for l in get_limiters()}))
+        registry.register(Gauge(
+            "tekbetter_rate_limit_throttles", "503 and 429 answers of the upstream hosts, since the start", ["host"],
+            callback=lambda: {(l.host,): l.stats()["throttle_events"] for l in get_limiters() if l.adaptive}))
+        registry.register(Gauge(
+            "tekbetter_status_updates_dropped", "Task status updates dropped because the queue was full",
+            callback=lambda: {(): status_sender.dropped}))
+        registry.register(Gauge(
+            "tekbetter_log_lines_dropped", "Log lines dropped because the log queue was full",
+            callback=lambda: {(): get_dropped_logs()}))
+
+    def get_metrics(self, handler):
+        return 200, "text/plain; version=0.0.4; charset=utf-8", registry.render().encode("utf-8")
+
+    def is_authorized(self, handler) -> bool:
+        token = os.getenv("SERVER_API_TOKEN") or os.getenv("PUBLIC_SCRAPER_TOKEN")
+        if not token:
+            return False
+        return hmac.compare_digest(handler.headers.get("Authorization", ""), f"Bearer {token}")
+
+    def post_scrape(self, handler):
+        if not self.is_authorized(handler):
+            return json_response(401, {"error": "Unauthorized"})
+        try:
+            length = int(handler.headers.get("Content-Length", 0))
+            body = json.loads(handler.rfile.read(length) or b"{}")
+        except ValueError:
+            return json_response(400, {"error": "Invalid JSON body"})
+        if not isinstance(body, dict) or not isinstance(body.get("tasks", []), list):
+            return json_response(400, {"error": "Invalid JSON body"})
+
+        student = self.main.get_student(body.get("tekbetter_token"))
+        if student is None:
+            return json_response(404, {"error": "Unknown student"})
+        if not self.main.sharding.owns(student.tekbetter_token):
+            return json_response(421, {"error": "Student scraped by another shard"})
+        tasks = body.get("tasks") or list(self.main.intervals.keys())
+        invalid = [t for t in tasks if t not in self.main.intervals]
+        if invalid:
+            return json_response(400, {"error": f"Unknown tasks: {', '.join(map(str, invalid))}"})
+
+        queued = self.main.trigger_scrape(student, tasks)
+        student.log_scrap(f"Scrape triggered for {', '.join(tasks)}")
+        return json_response(202, {"queued": queued, "already_queued": [t for t in tasks if t not in queued]})
+
+    def get_logs(self, handler):
+        if not self.is_authorized(handler):
+            return json_response(401, {"error": "Unauthorized"})
+        student = parse_qs(urlsplit(handler.path).query).get("student", [""])[0]
+        if not student:
+            return json_response(400, {"error": "Missing student parameter"})
+        return json_response(200, {"student": student, "logs": get_recent_logs(student)})
+
+    def start(self):
+        """
+        Start the server in a background thread, if SERVER_API_PORT is set
+        """
+        port = os.getenv("SERVER_API_PORT")
+        if not port:
+            return
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                route = api.routes.get((method, urlsplit(self.path).path))
+                if route is None:
+                    status, content_type, body = 404, "text/plain", b"Not found"
+                else:
+                    try:
+                        status, content_type, body = route(self)
+                    except Exception as e:
+                        log_error(f"Server API error on {method} {self.path}: {e}")
+                        status, content_type, body = 500, "text/plain", b"Internal error"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((os.getenv("SERVER_API_HOST", "0.0.0.0"), int(port)), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="server-api", daemon=True).start()
+        log_info(f"Server API listening on port {port}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
@@ -0,0 +1,69 @@
+import gzip
+import json
+import os
+import time
+
+from app.logger import log_warning
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_zstd_warned = False
+
+
+def _compress(body: bytes, encoding: str):
+    global _zstd_warned
+    if encoding == "zstd":
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+        if not _zstd_warned:
+            _zstd_warned = True
+            log_warning("PUSH_COMPRESSION is zstd but the zstandard package is not installed, using gzip")
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def encode_json_body(data):
+    """
+    Serialize a request body to JSON, and compress it with PUSH_COMPRESSION (gzip or zstd) if it is at least
+    PUSH_COMPRESSION_MIN_SIZE bytes
+    :param data: JSON-serializable data
+    :return: Body bytes, headers to send with it and statistics about the encoding
+    """
+    start = time.perf_counter()
+    body = json.dumps(data, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    serialize_time = time.perf_counter() - start
+
+    headers = {"Content-Type": "application/json"}
+    stats = {
+        "raw_size": len(body),
+        "sent_size": len(body),
+        "encoding": None,
+        "serialize_time": serialize_time,
+        "compress_time": 0,
+    }
+
+    encoding = os.getenv("PUSH_COMPRESSION", "").lower()
+    if encoding not in ("gzip", "zstd") or len(body) < int(os.getenv("PUSH_COMPRESSION_MIN_SIZE", 16384)):
+        return body, headers, stats
+
+    start = time.perf_counter()
+    body, encoding = _compress(body, encoding)
+    stats["compress_time"] = time.perf_counter() - start
+    stats["sent_size"] = len(body)
+    stats["encoding"] = encoding
+    headers["Content-Encoding"] = encoding
+    return body, headers, stats
+
+
+def describe_encoding(stats: dict) -> str:
+    """
+    Human-readable summary of the statistics returned by encode_json_body
+    """
+    text = f"{stats['raw_size'] / 1024:.1f} KB serialized in {stats['serialize_time'] * 1000:.1f}ms"
+    if stats["encoding"]:
+        ratio = stats["raw_size"] / max(1, stats["sent_size"])
+        text += (f", {stats['encoding']} to {stats['sent_size'] / 1024:.1f} KB (ratio x{ratio:.1f})"
+                 f" in {stats['compress_time'] * 1000:.1f}ms")
+    return text
@@ -2,20 +2,51 @@ import json
 import os
 import time
 
-import requests
-
-from app.intranet.intranet_antiddos_bypass import IntranetAntiDDoSBypasser
-from app.logger import log_info, log_error, log_warning
+from app.intranet.intranet_antiddos_bypass import antiddos_cookies
+from app.logger import log_debug, log_info, log_error, log_warning
 from app.model.Student import Student, TaskType
+from app.tools.http_pool import get_session
+
+
+def create_student(entry: dict, main) -> Student:
+    student_obj = Student()
+    student_obj.antiddos = antiddos_cookies
+    student_obj.microsoft_session = entry["microsoft_session"]
+    student_obj.tekbetter_token = entry["tekbetter_token"]
+    if "." in student_obj.tekbetter_token and "_" in student_obj.tekbetter_token:
+        student_obj.student_label = student_obj.tekbetter_token.split("_")[0]
+    student_obj.main = main
+    student_obj.restore_tokens()
+    return student_obj
 
 
-def get_or_create(token, students):
-    for student in students:
-        if student.tekbetter_token == token:
-            return student, False
-    s = Student()
-    s.antiddos = IntranetAntiDDoSBypasser()
-    return s, True
+def apply_students(main, entries: list):
+    """
+    Apply the students of a new configuration as a diff of main.students_by_token:
+    new students are created, missing ones removed, and the ones whose Microsoft session changed are logged out.
+    Unchanged students are kept as they are, with their tokens and scrape history.
+    :param main: Main object
+    :param entries: Students of the configuration
+    """
+    wanted = {entry["tekbetter_token"]: entry for entry in entries}
+    added, changed = 0, 0
+    for token, entry in wanted.items():
+        student_obj = main.students_by_token.get(token)
+        if student_obj is None:
+            main.students_by_token[token] = create_student(entry, main)
+            added += 1
+        elif student_obj.microsoft_session != entry["microsoft_session"]:
+            student_obj.microsoft_session = entry["microsoft_session"]
+            student_obj.reset_tokens()
+            changed += 1
+
+    removed = [token for token in main.students_by_token if token not in wanted]
+    for token in removed:
+        del main.students_by_token[token]
+    # Rebind instead of mutating: the schedulers iterate over the previous list without lock
+    main.students = list(main.students_by_token.values())
+    log_info(f"Config reload successful: {len(main.students)} students loaded "
+             f"({added} added, {len(removed)} removed, {changed} sessions changed)")
 
 
 def load_configuration(main):
@@ -34,13 +65,18 @@ def load_configuration(main):
         else:
             json_data = {}
     else:
-        res = requests.get(f"{os.getenv('TEKBETTER_API_URL')}/api/scraper/config", headers={
-            "Authorization": f"Bearer {os.getenv('PUBLIC_SCRAPER_TOKEN')}"
-        })
+        headers = {"Authorization": f"Bearer {os.getenv('PUBLIC_SCRAPER_TOKEN')}"}
+        if main.config_etag:
+            headers["If-None-Match"] = main.config_etag
+        res = get_session().get(f"{os.getenv('TEKBETTER_API_URL')}/api/scraper/config", headers=headers)
+        if res.status_code == 304:
+            log_debug("Config unchanged since the last reload")
+            return True
         if res.status_code != 200:
             log_error("Failed to fetch config from TekBetter API")
             return False
         json_data = res.json()
+        main.config_etag = res.headers.get("ETag")
 
     if "student_interval" in json_data:
         log_warning("Config warning: \"student_interval\" key is deprecated, use \"intervals\" instead. Please refer to the documentation.")
@@ -55,22 +91,7 @@ def load_configuration(main):
             student["tekbetter_token"] = ""
 
 
-    # Add new students to the list
-    for student in json_data["students"]:
-        student_obj, created = get_or_create(student["tekbetter_token"], main.students)
-        student_obj.microsoft_session = student["microsoft_session"]
-        student_obj.tekbetter_token = student["tekbetter_token"]
-        if "." in student_obj.tekbetter_token and "_" in student_obj.tekbetter_token:
-            student_obj.student_label = student_obj.tekbetter_token.split("_")[0]
-        if created:
-            main.students.append(student_obj)
-        student_obj.main = main
-
-    # Remove students that are not in the config anymore
-    for student in main.students:
-        if len([s for s in json_data["students"] if s["tekbetter_token"] == student.tekbetter_token]) == 0:
-            main.students.remove(student)
-    log_info("Config reload successful: " + str(len(main.students)) + " students loaded")
+    apply_students(main, json_data["students"])
 
     translations = {
         "moulinettes": TaskType.MOULI,
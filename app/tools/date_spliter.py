@@ -6,6 +6,9 @@ import requests
 from app.logger import log_info, log_error, log_warning
 from app.model.Student import Student
 
+# Origin of the grid of split_aligned_dates
+GRID_ORIGIN = datetime(2000, 1, 1)
+
 def split_dates(start: str, end: str, max_days: int) -> [(str, str)]:
     """
     Split a date range into multiple ranges of a maximum number of days
@@ -30,4 +33,27 @@ def split_dates(start: str, end: str, max_days: int) -> [(str, str)]:
             current_end = end_date
         dates.append((current_start.strftime("%Y-%m-%d"), current_end.strftime("%Y-%m-%d")))
         current_start = current_end + timedelta(days=1)
-    return dates
\ No newline at end of file
+    return dates
+
+
+def split_aligned_dates(start: str, end: str, max_days: int) -> [(str, str)]:
+    """
+    Split a date range into ranges of max_days days (end included) on a fixed grid starting at GRID_ORIGIN,
+    so a range is the same from one day to the next. The first and last ranges may start before start and
+    end after end: the caller has to trim what they fetch to the range.
+    :param start:
+    :param end:
+    :param max_days:
+    :return:
+    """
+    step = timedelta(days=max_days + 1)
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.strptime(end, "%Y-%m-%d")
+
+    current_start = GRID_ORIGIN + step * ((start_date - GRID_ORIGIN) // step)
+    dates = []
+    while current_start <= end_date:
+        current_end = current_start + timedelta(days=max_days)
+        dates.append((current_start.strftime("%Y-%m-%d"), current_end.strftime("%Y-%m-%d")))
+        current_start += step
+    return dates
@@ -0,0 +1,12 @@
+import hashlib
+import json
+
+
+def section_hash(data) -> str:
+    """
+    Content hash of a scraped section, independent of the keys order
+    :param data: JSON-serializable data
+    :return: Hex digest
+    """
+    serialized = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
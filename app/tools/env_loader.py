@@ -30,4 +30,7 @@ def check_env_variables():
         elif not os.access(os.getenv("SCRAPER_CONFIG_FILE"), os.W_OK):
             log_error(f"{os.getenv('SCRAPER_CONFIG_FILE')} is not writable")
             valid = False
+    if int(os.getenv("SHARD_COUNT", 1)) > 1 and not 0 <= int(os.getenv("SHARD_INDEX", 0)) < int(os.getenv("SHARD_COUNT")):
+        log_error("SHARD_INDEX must be between 0 and SHARD_COUNT - 1")
+        valid = False
     return valid
\ No newline at end of file
@@ -0,0 +1,263 @@
+import atexit
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.cookies import create_cookie
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from app.logger import log_info, log_warning
+
+REDACTED = "REDACTED"
+# Query and fragment parameters whose values are credentials
+SECRET_PARAMS = {"code", "id_token", "access_token", "refresh_token", "nonce", "session_state", "client_info"}
+# Parts of the JSON keys whose values are credentials (tekbetter_token, microsoft_session, ...)
+SECRET_KEY_PARTS = ("token", "session", "password", "secret", "autologin", "cookie", "credential")
+# JSON keys whose values are names of people, replaced by pseudonyms
+NAME_KEYS = {"firstname", "lastname", "title"}
+# Response headers kept in a cassette, the others are dropped
+KEPT_HEADERS = {"content-type", "location", "set-cookie", "etag"}
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+
+
+def _without_query(url: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+class Cassette:
+    """
+    Record of upstream HTTP exchanges, as gzip JSON lines: a header line, then one line per response.
+    Never written: request headers and bodies (Authorization, cookies, pushed data), cookie values, tokens
+    and codes in urls, JSON values whose key contains a SECRET_KEY_PARTS, and the TekBetter API exchanges
+    (see get_cassette). Emails and names are replaced by pseudonyms, keyed by a salt kept in the cassette,
+    so a replayed scrape asks the same urls as the recorded one. Pictures are blanked.
+    """
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self.speed = float(os.getenv("HTTP_REPLAY_SPEED", 1))
+        self._lock = threading.Lock()
+        self._file = None
+        self._interactions = {}
+        self._by_path = {}
+        self._cursors = {}
+        self._missed = set()
+        if mode == "record":
+            self.salt = secrets.token_hex(16)
+            self._file = gzip.open(path, "wb")
+            self._write({"cassette": 1, "salt": self.salt, "recorded_at": time.time()})
+            atexit.register(self.close)
+        else:
+            self.salt = ""
+            self._load()
+
+    def _write(self, line: dict):
+        self._file.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+        # Sync flush: a cassette stays readable up to the last response if the process is killed
+        self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _load(self):
+        count = 0
+        with gzip.open(self.path, "rb") as file:
+            try:
+                for raw_line in file:
+                    line = json.loads(raw_line)
+                    if "cassette" in line:
+                        self.salt = line["salt"]
+                        continue
+                    self._interactions.setdefault((line["method"], line["url"]), []).append(line)
+                    self._by_path.setdefault((line["method"], _without_query(line["url"])), []).append(line)
+                    count += 1
+            except EOFError:
+                log_warning(f"Cassette {self.path} is truncated, replaying the {count} complete responses")
+        log_info(f"Replaying {count} HTTP responses from {self.path}")
+
+    def pseudonym(self, email: str) -> str:
+        digest = hmac.new(self.salt.encode("utf-8"), email.lower().encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"user-{digest[:12]}@example.invalid"
+
+    def name_pseudonym(self, name: str) -> str:
+        digest = hmac.new(self.salt.encode("utf-8"), name.lower().encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"name-{digest[:8]}"
+
+    def sanitize_text(self, text: str) -> str:
+        return EMAIL_PATTERN.sub(lambda match: self.pseudonym(match.group()), text)
+
+    def sanitize_url(self, url: str) -> str:
+        parts = urlsplit(url)
+
+        def sanitize_params(params: str) -> str:
+            if "=" not in params:
+                return params
+            return urlencode([(k, REDACTED if k.lower() in SECRET_PARAMS else v)
+                              for k, v in parse_qsl(params, keep_blank_values=True)])
+
+        return self.sanitize_text(urlunsplit((parts.scheme, parts.netloc, parts.path, sanitize_params(parts.query),
+                                              sanitize_params(parts.fragment))))
+
+    def sanitize_json(self, data, secret=False):
+        """
+        :param secret: True under a key containing a SECRET_KEY_PARTS, every value is then redacted
+        """
+        if isinstance(data, dict):
+            sanitized = {}
+            for key, value in data.items():
+                if key.lower() in NAME_KEYS and isinstance(value, str) and not secret:
+                    sanitized[key] = self.name_pseudonym(value)
+                else:
+                    sanitized[key] = self.sanitize_json(
+                        value, secret or any(part in key.lower() for part in SECRET_KEY_PARTS))
+            return sanitized
+        if isinstance(data, list):
+            return [self.sanitize_json(item, secret) for item in data]
+        if secret and data is not None:
+            return REDACTED
+        if isinstance(data, str):
+            return self.sanitize_text(data)
+        return data
+
+    def sanitize_set_cookie(self, header: str) -> str:
+        name, _, rest = header.partition("=")
+        _, separator, attributes = rest.partition(";")
+        return f"{name}={REDACTED}{separator}{attributes}"
+
+    def record(self, request, response, duration: float):
+        """
+        Write a sanitized copy of an upstream response
+        :param request: Prepared request, with the real url
+        :param response: Response of the request
+        :param duration: Duration of the request, in seconds
+        """
+        headers = []
+        raw_headers = getattr(response.raw, "headers", None)
+        # The raw headers keep each Set-Cookie apart, response.headers joins them
+        for name, value in (raw_headers.iteritems() if raw_headers is not None else response.headers.items()):
+            if name.lower() not in KEPT_HEADERS:
+                continue
+            if name.lower() == "set-cookie":
+                value = self.sanitize_set_cookie(value)
+            elif name.lower() == "location":
+                value = self.sanitize_url(value)
+            headers.append([name, value])
+
+        line = {"method": request.method, "url": self.sanitize_url(request.url), "status": response.status_code,
+                "reason": response.reason, "headers": headers, "duration": round(duration, 4)}
+        content_type = response.headers.get("Content-Type", "")
+        content = response.content or b""
+        if "json" in content_type:
+            try:
+                line["body"] = json.dumps(self.sanitize_json(json.loads(content)), ensure_ascii=False)
+            except ValueError:
+                line["body"] = self.sanitize_text(content.decode("utf-8", "replace"))
+        elif content_type.startswith("image/"):
+            line["body_base64"] = base64.b64encode(content[:4] + bytes(max(0, len(content) - 4))).decode("ascii")
+        else:
+            line["body"] = self.sanitize_text(content.decode("utf-8", "replace"))
+
+        with self._lock:
+            if self._file is not None:
+                self._write(line)
+
+    def _next(self, key, index: dict):
+        interactions = index.get(key)
+        if not interactions:
+            return None
+        with self._lock:
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+        return interactions[cursor % len(interactions)]
+
+    def replay(self, request) -> Response:
+        """
+        Build the recorded response of a request: the responses of the same url are served in the recorded
+        order, then again from the first one. Urls never recorded (e.g. other dates) get the responses of the
+        same path, and a 404 if the path was never recorded either.
+        :param request: Prepared request
+        :return: Response, after waiting the recorded duration divided by HTTP_REPLAY_SPEED
+        """
+        url = self.sanitize_url(request.url)
+        line = self._next((request.method, url), self._interactions)
+        if line is None:
+            line = self._next((request.method, _without_query(url)), self._by_path)
+        if line is None:
+            with self._lock:
+                first_miss = url not in self._missed
+                self._missed.add(url)
+            if first_miss:
+                log_warning(f"No recorded response for {request.method} {url}")
+            line = {"status": 404, "reason": "Not Found", "headers": [["Content-Type", "application/json"]],
+                    "body": json.dumps({"error": "Not in the cassette"}), "duration": 0}
+
+        if self.speed > 0 and line["duration"]:
+            time.sleep(line["duration"] / self.speed)
+
+        response = Response()
+        response.status_code = line["status"]
+        response.reason = line["reason"]
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        headers = CaseInsensitiveDict()
+        for name, value in line["headers"]:
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+            if name.lower() == "set-cookie":
+                try:
+                    cookies = SimpleCookie(value).values()
+                except CookieError:
+                    continue
+                for cookie in cookies:
+                    expires = None
+                    if cookie["expires"]:
+                        expires = int(parsedate_to_datetime(cookie["expires"]).timestamp())
+                    response.cookies.set_cookie(create_cookie(cookie.key, cookie.value, expires=expires,
+                                                              path=cookie["path"] or "/"))
+        response.headers = headers
+        response._content = base64.b64decode(line["body_base64"]) if "body_base64" in line \
+            else line["body"].encode("utf-8")
+        response._content_consumed = True
+        return response
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette(origin: str):
+    """
+    Get the cassette of the process, from HTTP_CASSETTE_MODE ("record" or "replay") and HTTP_CASSETTE_FILE.
+    The TekBetter API is never recorded nor replayed: its config holds the sessions and tokens of every student.
+    :param origin: scheme://netloc of the requests
+    :return: Cassette, or None if no mode is set or for the TekBetter API
+    """
+    global _cassette
+    mode = os.getenv("HTTP_CASSETTE_MODE", "").lower()
+    if mode not in ("record", "replay"):
+        return None
+    api_url = urlsplit(os.getenv("TEKBETTER_API_URL", ""))
+    if origin == f"{api_url.scheme}://{api_url.netloc}".lower():
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            path = os.getenv("HTTP_CASSETTE_FILE", "cassette.jsonl.gz")
+            _cassette = Cassette(path, mode)
+            log_info(f"HTTP cassette {path}: {mode}")
+        return _cassette
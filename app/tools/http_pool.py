@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.tools.http_cassette import get_cassette
+from app.tools.metrics import HTTP_DURATION, HTTP_REQUESTS
+from app.tools.rate_limiter import get_limiter
+
+
+class _NoPersistCookiePolicy(DefaultCookiePolicy):
+    """
+    Cookie policy refusing to store any cookie in the shared session jar.
+    Cookies are always given per request, so the students never see each other's cookies.
+    Redirect chains still work: requests carries the cookies of each hop in the prepared request itself.
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+_adapters = {}
+_adapters_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_pool_size() -> int:
+    """
+    Number of keep-alive connections kept per upstream host.
+    Defaults to the fan-out of the scrapes: each of the MAX_THREADS students runs STUDENT_MAX_TASKS tasks at a time,
+    and a task sends up to INTRANET_WINDOW_WORKERS or MYEPITECH_WORKERS requests at a time. Not the concurrency limit
+    of the host: a streamed response keeps its connection after the limiter released its slot, until it is read.
+    The connections are only opened when needed, a large pool costs nothing while unused.
+    """
+    task_fan_out = max(int(os.getenv("INTRANET_WINDOW_WORKERS", 4)), int(os.getenv("MYEPITECH_WORKERS", 4)))
+    fan_out = int(os.getenv("MAX_THREADS", 10)) * int(os.getenv("STUDENT_MAX_TASKS", 4)) * task_fan_out
+    return int(os.getenv("HTTP_POOL_SIZE", fan_out))
+
+
+def get_upstream_overrides() -> dict:
+    """
+    Upstream hosts redirected to other servers, from HTTP_UPSTREAM_OVERRIDES
+    (example: "https://intra.epitech.eu=http://127.0.0.1:9001,https://api.epitest.eu=http://127.0.0.1:9002").
+    Used to run the scraper against local stand-in servers, for the benchmarks.
+    """
+    overrides = {}
+    for item in os.getenv("HTTP_UPSTREAM_OVERRIDES", "").split(","):
+        if "=" in item:
+            origin, target = item.split("=", 1)
+            overrides[origin.strip().rstrip("/").lower()] = target.strip().rstrip("/")
+    return overrides
+
+
+class _HostAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool of one upstream host, whose requests go through the limiter of the host.
+    The limiter is taken per hop, so following a redirect never waits on a slot held by the same request.
+    With an HTTP cassette, the responses are recorded, or served from the cassette instead of the network.
+    """
+
+    def __init__(self, pool_size: int, host: str, override: str = None, cassette=None):
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+        self.host = host
+        self.limiter = get_limiter(host)
+        self.override = override
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        status_code = None
+        start = time.perf_counter()
+        try:
+            if self.cassette is not None and self.cassette.mode == "replay":
+                response = self.cassette.replay(request)
+            elif self.override is None:
+                response = super().send(request, **kwargs)
+            else:
+                response = self._send_overridden(request, **kwargs)
+            status_code = response.status_code
+            if self.cassette is not None and self.cassette.mode == "record":
+                self.cassette.record(request, response, time.perf_counter() - start)
+            return response
+        finally:
+            self.limiter.release(status_code)
+            status = status_code if status_code is not None else "error"
+            HTTP_REQUESTS.inc(host=self.host, status=status)
+            HTTP_DURATION.observe(time.perf_counter() - start, host=self.host, status=status)
+
+    def _send_overridden(self, request, **kwargs):
+        # The request is sent to the override server, but everything else (cookies, redirects) sees the real url
+        original_url = request.url
+        parts = urlsplit(original_url)
+        request = request.copy()
+        request.url = self.override + original_url[len(f"{parts.scheme}://{parts.netloc}"):]
+        response = super().send(request, **kwargs)
+        response.url = original_url
+        return response
+
+
+def get_host_adapter(url: str) -> HTTPAdapter:
+    """
+    Get the shared adapter (keep-alive connection pool) of the host of the given url
+    :param url: Full url of the request
+    :return: HTTPAdapter
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}".lower()
+    adapter = _adapters.get(key)
+    if adapter is not None:
+        return adapter
+    with _adapters_lock:
+        if key not in _adapters:
+            _adapters[key] = _HostAdapter(get_pool_size(), parts.hostname or "", get_upstream_overrides().get(key),
+                                          get_cassette(key))
+        return _adapters[key]
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session sharing one keep-alive pool per upstream host (intra.epitech.eu, api.epitest.eu,
+    login.microsoftonline.com, TekBetter API...) with every other session of the process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cookies.set_policy(_NoPersistCookiePolicy())
+
+    def get_adapter(self, url):
+        return get_host_adapter(url)
+
+
+def get_session() -> PooledSession:
+    """
+    Get the process-wide pooled session, used by all the HTTP clients of the scraper
+    :return: PooledSession
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession()
+    return _session
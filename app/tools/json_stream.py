@@ -0,0 +1,78 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def _skip_whitespace(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+class _ArrayParser:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.empty = True
+
+    def feed(self, text: str, final: bool):
+        """
+        Add text to the buffer, and parse the items it completes
+        :param final: True if no text follows: what can't be parsed is an error instead of a cut item
+        :return: List of the parsed items
+        """
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        items = []
+        while not self.finished:
+            pos = _skip_whitespace(self.buffer, self.pos)
+            if pos >= len(self.buffer):
+                break
+            if not self.started:
+                if self.buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                self.started = True
+                self.pos = pos + 1
+                continue
+            if self.empty and self.buffer[pos] == "]":
+                self.finished = True
+                self.pos = pos + 1
+                break
+            try:
+                item, end = _decoder.raw_decode(self.buffer, pos)
+                end = _skip_whitespace(self.buffer, end)
+                if end >= len(self.buffer) or self.buffer[end] not in ",]":
+                    # A number may continue in the next chunk ("12" then "34"), the item is complete only here
+                    raise ValueError(f"Invalid JSON array at character {end}")
+            except ValueError:
+                if final:
+                    raise
+                break
+            self.finished = self.buffer[end] == "]"
+            self.empty = False
+            self.pos = end + 1
+            items.append(item)
+        return items
+
+
+def iter_json_array(chunks):
+    """
+    Parse a JSON array from chunks of bytes, yielding its items as soon as they are complete:
+    only the items of the current chunk are kept in memory, never the whole array.
+    An item is only yielded once followed by "," or "]", so a number cut between two chunks is never yielded half.
+    :param chunks: Iterable of bytes, e.g. response.iter_content()
+    :return: Generator of the items
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    parser = _ArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(utf8.decode(chunk), final=False)
+    yield from parser.feed(utf8.decode(b"", final=True), final=True)
+    if not parser.finished:
+        raise ValueError("Truncated JSON array")
+    if parser.buffer[parser.pos:].strip():
+        raise ValueError("Unexpected data after the JSON array")
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+from app.config import RATE_LIMITED_HOSTS
+from app.logger import log_info, log_warning
+
+
+class AdaptiveLimiter:
+    """
+    Limiter of the requests sent to one upstream host, shared by all students.
+    A token bucket caps the request rate, and the number of requests in flight follows AIMD:
+    the limit grows by one slot per window of successful requests, and is halved on a 503 or 429.
+    """
+
+    def __init__(self, host: str, rate: float, max_concurrency: int, adaptive: bool):
+        self.host = host
+        self.rate = rate
+        # At least one token: below 1 request/s, the bucket would never hold a whole token
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = 1
+        self.limit = float(max_concurrency)
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.throttle_events = 0
+        self.last_backoff = 0
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """
+        Wait for a free slot and a token, then count the request as in flight
+        """
+        with self._condition:
+            while True:
+                wait = None
+                if self.rate > 0:
+                    self._refill()
+                    if self.tokens < 1:
+                        wait = (1 - self.tokens) / self.rate
+                if wait is None and (self.max_concurrency <= 0 or self.in_flight < int(self.limit)):
+                    if self.rate > 0:
+                        self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                self._condition.wait(timeout=wait)
+
+    def release(self, status_code=None):
+        """
+        Count the request as done, and adapt the concurrency limit to its response status
+        :param status_code: Response status code, None if the request failed without response
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive and status_code in (429, 503):
+                self._back_off(status_code)
+            elif self.adaptive and status_code is not None and self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def _back_off(self, status_code: int):
+        self.throttle_events += 1
+        now = time.monotonic()
+        # The requests in flight when the host started refusing are answered together: back off once for them
+        if now - self.last_backoff < 1:
+            return
+        self.last_backoff = now
+        previous = self.limit
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        log_warning(f"[RATE] {self.host} answered {status_code}, concurrency limit {previous:.1f} -> {self.limit:.1f}")
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "host": self.host,
+                "limit": self.limit,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "rate": self.rate,
+                "throttle_events": self.throttle_events,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(host: str) -> AdaptiveLimiter:
+    """
+    Get the limiter of an upstream host. The hosts of RATE_LIMITED_HOSTS have an adaptive concurrency limit, up to
+    HTTP_MAX_PER_HOST (default 32), and are rate limited to HTTP_RATE_LIMIT requests per second if it is set: a fixed
+    rate would be the limit long before the adaptive concurrency, so it is only for a known upstream quota.
+    The other hosts only have the fixed HTTP_MAX_PER_HOST limit, if set.
+    """
+    host = host.lower()
+    with _limiters_lock:
+        if host not in _limiters:
+            max_per_host = int(os.getenv("HTTP_MAX_PER_HOST", 0))
+            if host in RATE_LIMITED_HOSTS:
+                limiter = AdaptiveLimiter(host, float(os.getenv("HTTP_RATE_LIMIT", 0)), max_per_host or 32, True)
+                rate = f"{limiter.rate:g} requests/s" if limiter.rate > 0 else "no rate limit"
+                log_info(f"[RATE] {host}: {rate}, up to {limiter.max_concurrency} in flight")
+            else:
+                limiter = AdaptiveLimiter(host, 0, max_per_host, False)
+            _limiters[host] = limiter
+        return _limiters[host]
+
+
+def get_limiters() -> list:
+    """
+    Get all the limiters created so far
+    """
+    with _limiters_lock:
+        return list(_limiters.values())
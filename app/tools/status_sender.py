@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import deque
+
+from app.logger import log_error, log_warning
+from app.tools.http_pool import get_session
+
+
+class StatusSender:
+    """
+    Background sender of the task statuses (/api/scraper/status), so a slow TekBetter API never blocks a scrape.
+    Updates are queued in a bounded queue (the oldest are dropped when it is full), then a single flusher thread
+    merges them per student, and sends the pending updates of all students every STATUS_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._sending = False
+        self.dropped = 0
+
+    def _start(self):
+        self._queue = deque(maxlen=int(os.getenv("STATUS_QUEUE_SIZE", 10000)))
+        self._thread = threading.Thread(target=self._run, name="status-sender", daemon=True)
+        self._thread.start()
+
+    def send(self, tekbetter_token: str, student_label: str, status: dict):
+        """
+        Queue a status update of a student, without waiting for it to be sent
+        :param tekbetter_token: TekBetter token of the student
+        :param student_label: Student label, for the logs
+        :param status: Dict of task type -> task status
+        """
+        with self._condition:
+            if self._thread is None:
+                self._start()
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    log_warning(f"Task status queue is full, {self.dropped} updates dropped so far")
+            self._queue.append((tekbetter_token, student_label, dict(status)))
+            self._condition.notify_all()
+
+    def flush(self, timeout: float = 10):
+        """
+        Wait until all the queued updates are sent
+        :param timeout: Maximum number of seconds to wait
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while (self._queue or self._sending) and time.time() < deadline:
+                self._condition.wait(timeout=max(0.0, deadline - time.time()))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+            # Let the updates of the running scrapes accumulate, to merge them
+            time.sleep(float(os.getenv("STATUS_FLUSH_INTERVAL", 1)))
+
+            with self._condition:
+                batch = list(self._queue)
+                self._queue.clear()
+                self._sending = True
+
+            merged = {}
+            for tekbetter_token, student_label, status in batch:
+                merged.setdefault(tekbetter_token, (student_label, {}))[1].update(status)
+            for tekbetter_token, (student_label, status) in merged.items():
+                self._post(tekbetter_token, student_label, status)
+
+            with self._condition:
+                self._sending = False
+                self._condition.notify_all()
+
+    def _post(self, tekbetter_token: str, student_label: str, status: dict):
+        try:
+            api_url = os.getenv("TEKBETTER_API_URL")
+            get_session().post(
+                f"{api_url}/api/scraper/status",
+                json=status,
+                headers={"Authorization": f"Bearer {tekbetter_token}"},
+                timeout=10
+            )
+        except Exception as e:
+            log_error(f"Failed to send task status for student: {student_label}")
+            log_error(str(e))
+
+
+status_sender = StatusSender()
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from app.logger import log_info, log_error
+
+
+def decode_jwt_expiry(token: str):
+    """
+    Read the expiry ("exp" claim) of a JWT, without checking its signature
+    :param token: JWT string
+    :return: Expiry timestamp, or None if the token can't be decoded
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class TokenStore:
+    """
+    SQLite cache of the MyEpitech and intranet tokens of the students, so a restart doesn't log every student in
+    again. Students are keyed by a hash of their TekBetter token, which is never written to the disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tokens (
+                    student_key TEXT NOT NULL,
+                    service TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (student_key, service)
+                )
+            """)
+            self._db.execute("DELETE FROM tokens WHERE expires_at < ?", (time.time(),))
+
+    @staticmethod
+    def _student_key(tekbetter_token: str) -> str:
+        return hashlib.sha256(tekbetter_token.encode("utf-8")).hexdigest()
+
+    def save(self, tekbetter_token: str, service: str, token: str, expires_at: float):
+        """
+        Save the token of a student for the given service ("myepitech" or "intra")
+        """
+        if not tekbetter_token or not token or not expires_at:
+            return
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tokens (student_key, service, token, expires_at) VALUES (?, ?, ?, ?)",
+                    (self._student_key(tekbetter_token), service, token, expires_at)
+                )
+        except sqlite3.Error as e:
+            log_error(f"Failed to save token in {self.path}: {e}")
+
+    def load(self, tekbetter_token: str, service: str):
+        """
+        Load the token of a student for the given service, if it is still valid
+        :return: (token, expires_at), or (None, 0)
+        """
+        if not tekbetter_token:
+            return None, 0
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT token, expires_at FROM tokens WHERE student_key = ? AND service = ? AND expires_at > ?",
+                    (self._student_key(tekbetter_token), service, time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            log_error(f"Failed to load token from {self.path}: {e}")
+            return None, 0
+        return (row[0], row[1]) if row else (None, 0)
+
+    def delete(self, tekbetter_token: str, service: str):
+        """
+        Forget the token of a student for the given service
+        """
+        try:
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM tokens WHERE student_key = ? AND service = ?",
+                                 (self._student_key(tekbetter_token), service))
+        except sqlite3.Error as e:
+            log_error(f"Failed to delete token from {self.path}: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_token_store():
+    """
+    Get the token store of the process, or None if TOKEN_STORE_FILE is not set
+    :return: TokenStore or None
+    """
+    global _store
+    path = os.getenv("TOKEN_STORE_FILE")
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = TokenStore(path)
+            log_info(f"Using the token store {path}")
+        return _store
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache, whose entries expire after a fixed number of seconds
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _get_locked(self, key, default):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get_locked(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """
+        Get a value, loading it with loader() on a miss.
+        Concurrent misses of the same key wait for a single load; if it fails, each of them loads by itself.
+        :param key: Cache key
+        :param loader: Function returning the value
+        :return: Cached or loaded value
+        """
+        missing = object()
+        with self._lock:
+            value = self._get_locked(key, missing)
+            if value is not missing:
+                return value
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._loading[key] = Future()
+
+        if not owner:
+            try:
+                return pending.result()
+            except Exception:
+                return loader()
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set_exception(e)
+            raise
+        self.set(key, value)
+        with self._lock:
+            self._loading.pop(key, None)
+        pending.set_result(value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
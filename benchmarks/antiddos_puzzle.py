@@ -0,0 +1,55 @@
+"""
+Compare the anti-DDoS puzzle solve latency of the native evaluator and of execjs (Node.js subprocess).
+
+Usage: python -m benchmarks.antiddos_puzzle [iterations]
+"""
+import random
+import statistics
+import sys
+import time
+
+from app.intranet.intranet_antiddos_bypass import IntranetAntiDDoSBypasser, evaluate_with_execjs
+from app.intranet.js_expression import evaluate_js_expression
+
+
+def make_puzzle() -> str:
+    first = f"{random.randint(0, 99999999):08d}"
+    second = f"{random.randint(0, 99999999):08d}"
+    return f'var _{random.randint(1000000, 9999999)} = parseInt("{first}", 10) + parseInt("{second}", 10);'
+
+
+def bench(name: str, solve, puzzles: list):
+    durations = []
+    for puzzle in puzzles:
+        start = time.perf_counter()
+        solve(puzzle)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    print(f"{name:>8}: mean {statistics.mean(durations):9.3f}ms  p50 {statistics.median(durations):9.3f}ms  "
+          f"p99 {p99:9.3f}ms  ({len(durations)} solves)")
+    return durations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    puzzles = [make_puzzle() for _ in range(iterations)]
+    expressions = [puzzle.split("=", 1)[1].replace(";", "").strip() for puzzle in puzzles]
+    bypasser = IntranetAntiDDoSBypasser()
+
+    native = bench("native", bypasser._extract_secretheader, puzzles)
+    try:
+        expected = [evaluate_with_execjs(expression) for expression in expressions[:20]]
+    except Exception as e:
+        print(f"  execjs: unavailable ({e})")
+        return
+    # Outside of the try: a different result is a bug of the native evaluator, not a missing execjs
+    for expression, result in zip(expressions, expected):
+        assert evaluate_js_expression(expression) == result, expression
+
+    execjs_durations = bench("execjs", evaluate_with_execjs, expressions)
+    print(f"Speedup (p50): x{statistics.median(execjs_durations) / statistics.median(native):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+"""
+Local stand-ins for the upstream services of the scraper: Microsoft login, my.epitech.eu, the intranet
+(with its anti-DDoS page), api.epitest.eu and the TekBetter API.
+Every server answers after a configurable latency, fails a configurable share of the requests with a 500,
+and counts its requests on GET /__stats.
+The answers are deterministic per student and per date window, so two scrapes of a student see the same data.
+
+Usage: python -m benchmarks.loadtest.mock_servers [--latency 0.05] [--error-rate 0.01] [--antiddos]
+Prints the environment variables pointing the scraper to the servers.
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+import secrets
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+UPSTREAMS = {
+    "microsoft": ["https://login.microsoftonline.com", "https://my.epitech.eu"],
+    "intranet": ["https://intra.epitech.eu"],
+    "epitest": ["https://api.epitest.eu"],
+}
+
+
+class MockConfig:
+    def __init__(self, latency=0.05, error_rate=0.0, antiddos=False, clearance_ttl=600, session_ttl=3600,
+                 events_per_window=200, activities_per_window=40, modules=30, projects_per_year=12):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.antiddos = antiddos
+        self.clearance_ttl = clearance_ttl
+        self.session_ttl = session_ttl
+        self.events_per_window = events_per_window
+        self.activities_per_window = activities_per_window
+        self.modules = modules
+        self.projects_per_year = projects_per_year
+
+
+def stable_int(*parts) -> int:
+    return zlib.crc32("/".join(map(str, parts)).encode("utf-8"))
+
+
+def make_jwt(login: str, ttl: int) -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+    return ".".join([encode({"alg": "none", "typ": "JWT"}), encode({"login": login, "exp": int(time.time()) + ttl}),
+                     secrets.token_hex(8)])
+
+
+def decode_jwt_login(token: str):
+    try:
+        payload = token.split(".")[1]
+        data = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return data["login"] if data["exp"] > time.time() else None
+    except (IndexError, KeyError, ValueError):
+        return None
+
+
+def make_planning_window(start: str, end: str, login: str, count: int) -> list:
+    """
+    Planning events of a date window, a few of them with the student registered
+    """
+    rng = random.Random(f"planning/{start}/{end}")
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    days = max(1, (datetime.strptime(end, "%Y-%m-%d") - start_date).days)
+    events = []
+    for i in range(count):
+        event_start = start_date + timedelta(days=rng.randrange(days), hours=rng.randint(8, 18))
+        code_event = f"event-{stable_int(start, end, i)}"
+        registered = stable_int(login, code_event) % 20 == 0
+        module = f"B-{rng.choice(['CPE', 'PSU', 'MAT', 'DOP', 'SEC', 'AIA'])}-{rng.randint(100, 600)}"
+        events.append({
+            "scolaryear": str(event_start.year), "codemodule": module, "codeinstance": "PAR-5-1",
+            "codeacti": f"acti-{stable_int(start, i)}", "codeevent": code_event, "semester": rng.randint(1, 10),
+            "instance_location": "FR/PAR", "titlemodule": f"Module {module}", "acti_title": f"Activity {i}",
+            "start": event_start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": (event_start + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S"),
+            "total_students_registered": rng.randint(0, 300), "title": None, "type_title": "Follow-up",
+            "type_code": "rdv", "is_rdv": "0", "nb_hours": "02:00:00", "allowed_planning_start": None,
+            "allowed_planning_end": None, "nb_group": rng.randint(1, 40), "nb_max_students_projet": None,
+            "room": {"code": f"FR/PAR/Room-{rng.randint(1, 30)}", "type": "salle", "seats": 40},
+            "dates": None, "module_available": True, "module_registered": registered, "past": False,
+            "allow_register": True, "event_registered": "registered" if registered else False, "display": "",
+            "project": False, "rdv_group_registered": None, "rdv_indiv_registered": None, "allow_token": False,
+            "register_student": True, "register_prof": False, "register_month": False,
+            "in_more_than_one_month": False, "calendar_type": "school",
+        })
+    return events
+
+
+def make_board_window(start: str, end: str, login: str, count: int) -> list:
+    """
+    Module board activities of a date window, a few of them projects the student is registered to
+    """
+    rng = random.Random(f"board/{start}/{end}")
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    days = max(1, (datetime.strptime(end, "%Y-%m-%d") - start_date).days)
+    activities = []
+    for i in range(count):
+        begin = start_date + timedelta(days=rng.randrange(days))
+        code_acti = f"acti-{stable_int(start, end, i)}"
+        activities.append({
+            "title_module": f"Module {i}", "codemodule": f"B-CPE-{100 + i}", "scolaryear": str(begin.year),
+            "codeinstance": "PAR-5-1", "code_location": "PAR", "begin_event": None, "end_event": None,
+            "seats": "0", "num_event": "1", "type_acti": "Project", "type_acti_code": rng.choice(["proj", "tp", "rdv"]),
+            "codeacti": code_acti, "acti_title": f"Project {i}", "num": "1",
+            "begin_acti": begin.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_acti": (begin + timedelta(days=21)).strftime("%Y-%m-%d %H:%M:%S"),
+            "registered": 1 if stable_int(login, code_acti) % 4 == 0 else 0, "info_creneau": None,
+            "project": f"Project {i}", "rights": ["student"],
+        })
+    return activities
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.statuses = {}
+        self.bytes_received = 0
+
+    def record(self, route: str, status: int, received: int):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.bytes_received += received
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {"requests": dict(self.requests), "statuses": dict(self.statuses),
+                    "bytes_received": self.bytes_received, "total": sum(self.requests.values())}
+
+
+class Request:
+    def __init__(self, handler: BaseHTTPRequestHandler, method: str, body: bytes):
+        parts = urlsplit(handler.path)
+        self.method = method
+        self.path = "/" + "/".join(p for p in parts.path.split("/") if p)
+        self.query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        self.headers = handler.headers
+        self.body = body
+        self.cookies = {}
+        for item in handler.headers.get("Cookie", "").split(";"):
+            if "=" in item:
+                name, value = item.strip().split("=", 1)
+                self.cookies[name] = value
+
+
+def response(status: int, body=b"", content_type="application/json", headers=None):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+    return status, [("Content-Type", content_type), *(headers or [])], body
+
+
+class MockService:
+    name = ""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.stats = Stats()
+
+    def route(self, request: Request) -> str:
+        """
+        Name of the requested route, for the stats
+        """
+        return request.path
+
+    def handle(self, request: Request):
+        raise NotImplementedError
+
+
+class MicrosoftMock(MockService):
+    """
+    login.microsoftonline.com authorize page, redirecting to MyEpitech with an id_token or to the intranet
+    with a code. Also serves the my.epitech.eu landing page.
+    """
+    name = "microsoft"
+
+    def handle(self, request: Request):
+        if request.path == "/index.html":
+            return response(200, b"<html>MyEpitech</html>", "text/html")
+        if request.path != "/common/oauth2/authorize":
+            return response(404, {"error": "Not found"})
+        session = request.cookies.get("ESTSAUTHPERSISTENT", "")
+        if not session.startswith("session-"):
+            return response(200, b"<html>Sign in to your account</html>", "text/html")
+        login = session[len("session-"):]
+        redirect_uri = request.query.get("redirect_uri", "")
+        if "my.epitech.eu" in redirect_uri:
+            location = f"{redirect_uri}#id_token={make_jwt(login, self.config.session_ttl)}"
+        else:
+            location = f"{redirect_uri}?code={quote(login)}.{secrets.token_hex(8)}&state=%2F"
+        return response(302, b"", "text/html", [("Location", location)])
+
+
+class IntranetMock(MockService):
+    """
+    intra.epitech.eu: anti-DDoS puzzle, office365 callback and the JSON endpoints read by the scraper
+    """
+    name = "intranet"
+
+    def __init__(self, config: MockConfig):
+        super().__init__(config)
+        self.lock = threading.Lock()
+        self.challenges = {}
+        self.clearances = {}
+        self.sessions = {}
+
+    def route(self, request: Request) -> str:
+        if request.path == "/module/board":
+            return request.path
+        if request.path.startswith("/module/"):
+            return "/module/{module}/project" if request.path.endswith("/project") else "/module/{module}"
+        if request.path.startswith("/file/"):
+            return "/file/{picture}"
+        return request.path
+
+    def has_clearance(self, request: Request) -> bool:
+        with self.lock:
+            return self.clearances.get(request.cookies.get("antiddos_clearance"), 0) > time.time()
+
+    def puzzle_page(self):
+        first, second = random.randint(0, 99999999), random.randint(0, 99999999)
+        challenge_id = secrets.token_hex(8)
+        variable = f"_{random.randint(1000000, 9999999)}"
+        with self.lock:
+            self.challenges[challenge_id] = first + second
+        script = "\n".join([
+            f'var {variable} = parseInt("{first:08d}", 10) + parseInt("{second:08d}", 10);',
+            "var xhttp = new XMLHttpRequest();",
+            "xhttp.open('POST', '/', true);",
+            "xhttp.setRequestHeader('Content-type', 'application/x-www-form-urlencoded');",
+            f"xhttp.setRequestHeader('X-Challenge', {variable});",
+            f"document.cookie = 'antiddos_challenge={challenge_id}' + '; path=/';",
+            "xhttp.send('name1=Henry&name2=Ford');",
+        ])
+        encoded = base64.b64encode(script.encode("utf-8")).decode("ascii")
+        body = f"<html><script>eval(decodeURIComponent(escape(window.atob('{encoded}'))))</script></html>"
+        return response(503, body.encode("utf-8"), "text/html")
+
+    def solve(self, request: Request):
+        with self.lock:
+            expected = self.challenges.pop(request.cookies.get("antiddos_challenge"), None)
+            if expected is None or request.headers.get("X-Challenge") != str(expected):
+                return response(403, b"", "text/html")
+            clearance = secrets.token_hex(16)
+            self.clearances[clearance] = time.time() + self.config.clearance_ttl
+        return response(204, b"", "text/html", [("Set-Cookie", f"antiddos_clearance={clearance}; path=/")])
+
+    def login(self, request: Request):
+        code = request.query.get("code", "")
+        if "." not in code:
+            return response(403, {"message": "Invalid code"})
+        token = f"{code.split('.')[0]}.{secrets.token_hex(16)}"
+        expires = time.time() + self.config.session_ttl
+        with self.lock:
+            self.sessions[token] = expires
+        cookie = f"user={token}; expires={formatdate(expires, usegmt=True)}; path=/; HttpOnly"
+        return response(302, b"", "text/html", [("Set-Cookie", cookie), ("Location", "https://intra.epitech.eu/")])
+
+    def handle(self, request: Request):
+        if self.config.antiddos:
+            if request.path == "/" and request.method == "POST":
+                return self.solve(request)
+            if not self.has_clearance(request):
+                return self.puzzle_page()
+        if request.path == "/auth/office365":
+            return self.login(request)
+
+        token = request.cookies.get("user", "")
+        with self.lock:
+            valid = self.sessions.get(token, 0) > time.time()
+        if not valid:
+            return response(403, {"message": "Veuillez vous connecter"})
+        login = token.split(".")[0]
+        if request.path == "/user":
+            return response(200, {"login": login, "title": login.split("@")[0], "credits": 120, "semester": 6,
+                                  "gpa": [{"gpa": "3.21", "cycle": "bachelor"}], "location": "FR/PAR",
+                                  "picture": f"/file/userprofil/profilview/{login}.jpg", "promo": 2027})
+        if request.path == "/planning/load":
+            return response(200, make_planning_window(request.query["start"], request.query["end"], login,
+                                                      self.config.events_per_window))
+        if request.path == "/module/board":
+            return response(200, make_board_window(request.query["start"], request.query["end"], login,
+                                                   self.config.activities_per_window))
+        if request.path == "/course/filter":
+            return response(200, [
+                {"id": 1000 + i, "code": f"B-MOD-{100 + i}", "scolaryear": 2024, "codeinstance": "PAR-5-1",
+                 "status": "ongoing" if stable_int(login, i) % 5 == 0 else "notregistered"}
+                for i in range(self.config.modules)
+            ])
+        if request.path.startswith("/module/"):
+            parts = request.path.strip("/").split("/")
+            if request.path.endswith("/project"):
+                return response(200, {"slug": f"{parts[4]}-slug"})
+            year, code, instance = parts[1:4]
+            registered = stable_int(login, int(code.rsplit("-", 1)[1]) - 100) % 5 == 0
+            return response(200, {"scolaryear": year, "codemodule": code, "codeinstance": instance,
+                                  "title": f"Module {code}", "description": "Module description\n" * 20,
+                                  "credits": "4", "student_registered": 1 if registered else 0,
+                                  "student_grade": "A" if registered else None,
+                                  "activites": [{"codeacti": f"acti-{i}", "title": f"Activity {i}"}
+                                                for i in range(10)]})
+        if request.path.startswith("/file/userprofil/profilview/"):
+            return response(200, b"\xff\xd8\xff\xe0" + bytes(20000), "image/jpeg")
+        return response(404, {"message": "Not found"})
+
+
+class EpitestMock(MockService):
+    """
+    api.epitest.eu, authenticated with the id_token given by the Microsoft mock
+    """
+    name = "epitest"
+
+    def route(self, request: Request) -> str:
+        parts = request.path.strip("/").split("/")
+        if len(parts) == 3 and parts[1] == "details":
+            return "/me/details/{id}"
+        if len(parts) == 4:
+            return "/me/{year}/{module}/{slug}"
+        return "/me/{year}"
+
+    def project(self, login: str, year: int, index: int, run: int = 0) -> dict:
+        slug = f"project-{year}-{index}"
+        return {
+            "project": {"slug": slug, "name": slug, "module": {"code": f"B-CPE-{100 + index}"}},
+            "results": {"testRunId": stable_int(login, year, index) % 10_000_000 + run * 10_000_000,
+                        "logins": [login, f"mate-{stable_int(slug) % 1000}@epitech.eu"], "prerequisites": 2,
+                        "skills": {f"skill-{i}": {"count": 10, "passed": stable_int(login, slug, i) % 11}
+                                   for i in range(5)}},
+            "date": f"{year}-10-01T12:00:00Z",
+        }
+
+    def handle(self, request: Request):
+        authorization = request.headers.get("Authorization", "")
+        login = decode_jwt_login(authorization[len("Bearer "):]) if authorization.startswith("Bearer ") else None
+        if login is None:
+            return response(403, {"message": "Forbidden"})
+        parts = request.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "me":
+            return response(404, {"message": "Not found"})
+        if parts[1] == "details" and len(parts) == 3:
+            return response(200, {"instance": {"moduleCode": "B-CPE-100"}, "skills": {},
+                                  "externalItems": [{"type": "coding-style-fail", "value": 0}],
+                                  "testRunId": int(parts[2]), "logs": "x" * 2000})
+        year = int(parts[1])
+        if len(parts) == 2:
+            return response(200, [self.project(login, year, i) for i in range(self.config.projects_per_year)])
+        if len(parts) == 4:
+            index = int(parts[3].rsplit("-", 1)[1])
+            return response(200, [self.project(login, year, index, run) for run in range(3)])
+        return response(404, {"message": "Not found"})
+
+
+class TekBetterMock(MockService):
+    """
+    TekBetter API: scraper config, infos, push and status endpoints.
+    The known tests and modules of a student are the ones it pushed before, as for the real API.
+    """
+    name = "tekbetter"
+
+    def __init__(self, config: MockConfig):
+        super().__init__(config)
+        self.lock = threading.Lock()
+        self.known_tests = {}
+        self.known_modules = {}
+        self.pushes = {}
+        self.students = []
+
+    def decode_body(self, request: Request):
+        encoding = request.headers.get("Content-Encoding", "")
+        body = request.body
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd":
+            if zstandard is None:
+                return None
+            body = zstandard.ZstdDecompressor().decompress(body)
+        return json.loads(body)
+
+    def handle(self, request: Request):
+        authorization = request.headers.get("Authorization", "")
+        if not authorization.startswith("Bearer "):
+            return response(401, {"error": "Unauthorized"})
+        token = authorization[len("Bearer "):]
+        if request.path == "/api/scraper/config":
+            body = json.dumps({"students": self.students}).encode("utf-8")
+            etag = f'"{zlib.crc32(body):08x}"'
+            if request.headers.get("If-None-Match") == etag:
+                return response(304, b"", headers=[("ETag", etag)])
+            return response(200, body, headers=[("ETag", etag)])
+        if request.path == "/api/scraper/infos":
+            with self.lock:
+                return response(200, {"known_tests": sorted(self.known_tests.get(token, set())),
+                                      "known_modules": sorted(self.known_modules.get(token, set())),
+                                      "asked_slugs": [], "need_picture_login": None})
+        if request.path == "/api/scraper/push" and request.method == "POST":
+            data = self.decode_body(request)
+            with self.lock:
+                self.pushes[token] = self.pushes.get(token, 0) + 1
+                if data is not None:
+                    self.known_tests.setdefault(token, set()).update(str(k) for k in (data.get("mouli") or {}))
+                    self.known_modules.setdefault(token, set()).update(
+                        m["id"] for m in (data.get("modules") or []) if m.get("id") is not None)
+            return response(200, {"success": True})
+        if request.path == "/api/scraper/status" and request.method == "POST":
+            return response(200, {"success": True})
+        return response(404, {"error": "Not found"})
+
+
+def serve(service: MockService, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Start a mock service in background threads
+    :return: The started server, listening on server.server_address
+    """
+    config = service.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _handle(self, method):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+            request = Request(self, method, body)
+            if request.path == "/__stats":
+                status, headers, data = response(200, service.stats.to_dict())
+            else:
+                if config.latency:
+                    time.sleep(random.uniform(0.5, 1.5) * config.latency)
+                if config.error_rate and random.random() < config.error_rate:
+                    status, headers, data = response(500, {"error": "Injected error"})
+                else:
+                    try:
+                        status, headers, data = service.handle(request)
+                    except (KeyError, ValueError, IndexError):
+                        status, headers, data = response(400, {"error": "Bad request"})
+                service.stats.record(service.route(request), status, len(body))
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, name=f"mock-{service.name}", daemon=True).start()
+    return server
+
+
+def start_all(config: MockConfig, students=None) -> dict:
+    """
+    Start all the mock services
+    :param students: Students listed by the TekBetter config endpoint
+    :return: Dict of service name -> base URL
+    """
+    urls = {}
+    for service_class in [MicrosoftMock, IntranetMock, EpitestMock, TekBetterMock]:
+        service = service_class(config)
+        if isinstance(service, TekBetterMock):
+            service.students = students or []
+        server = serve(service)
+        host, port = server.server_address[:2]
+        urls[service.name] = f"http://{host}:{port}"
+    return urls
+
+
+def scraper_env(urls: dict) -> dict:
+    """
+    Environment variables pointing the scraper to the mock services
+    """
+    overrides = [f"{origin}={urls[name]}" for name, origins in UPSTREAMS.items() for origin in origins]
+    return {"TEKBETTER_API_URL": urls["tekbetter"], "HTTP_UPSTREAM_OVERRIDES": ",".join(overrides)}
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean latency of the answers, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of the requests failing with a 500")
+    parser.add_argument("--antiddos", action="store_true", help="Require the intranet anti-DDoS clearance")
+    parser.add_argument("--clearance-ttl", type=int, default=600, help="Lifetime of an anti-DDoS clearance, seconds")
+    parser.add_argument("--session-ttl", type=int, default=3600, help="Lifetime of the login tokens, in seconds")
+    parser.add_argument("--events-per-window", type=int, default=200, help="Planning events per intranet window")
+    parser.add_argument("--activities-per-window", type=int, default=40, help="Board activities per window")
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(latency=args.latency, error_rate=args.error_rate, antiddos=args.antiddos,
+                      clearance_ttl=args.clearance_ttl, session_ttl=args.session_ttl,
+                      events_per_window=args.events_per_window, activities_per_window=args.activities_per_window)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    urls = start_all(config_from_args(args))
+    for name, value in scraper_env(urls).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
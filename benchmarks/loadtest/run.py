@@ -0,0 +1,207 @@
+"""
+Load test of the scraper against the local mock services (see mock_servers.py).
+The mock services run in a child process, so the measured peak RSS is the one of the scraper alone.
+N synthetic students are scraped by the real scheduler until each of them pushed --passes times
+(or --duration seconds elapsed), then the run is summarized.
+
+Usage: python -m benchmarks.loadtest.run [--students 50] [--engine threads|process] [--max-threads 10]
+                                         [--latency 0.05] [--error-rate 0.01] [--antiddos] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+
+from benchmarks.loadtest import mock_servers
+
+
+def run_mock_servers(config: mock_servers.MockConfig, students: list, connection):
+    urls = mock_servers.start_all(config, students)
+    connection.send(urls)
+    threading.Event().wait()
+
+
+def percentile(values: list, ratio: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))] if values else 0.0
+
+
+def fetch_stats(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/__stats", timeout=10) as res:
+        return json.loads(res.read())
+
+
+def make_students(count: int) -> list:
+    return [{"microsoft_session": f"session-student{i}@epitech.eu",
+             "tekbetter_token": f"student{i}@epitech.eu_{i:08d}.loadtest"} for i in range(count)]
+
+
+def scrape_until_done(main, args, completed: dict):
+    """
+    Run the scheduler of the selected engine until every student pushed args.passes times, or args.duration
+    """
+    deadline = time.time() + args.duration
+
+    def done():
+        return time.time() > deadline or all(completed.get(s.tekbetter_token, 0) >= args.passes
+                                             for s in main.students)
+
+    if args.engine == "process":
+        from app.engine.process_pool import ProcessEngine
+
+        engine = ProcessEngine(main)
+        for worker in engine.workers:
+            worker.start()
+        threading.Thread(target=engine.read_results, daemon=True).start()
+        while not done():
+            main.wakeup.wait(0.2)
+            main.wakeup.clear()
+            engine.sync_passage()
+        while any(worker.in_flight for worker in engine.workers):
+            time.sleep(0.2)
+        engine.stop()
+        return
+
+    while not done():
+        main.wakeup.wait(0.2)
+        main.wakeup.clear()
+        main.sync_passage()
+    for thread in main.threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the scraper against local mock services")
+    parser.add_argument("--students", type=int, default=50, help="Number of synthetic students")
+    parser.add_argument("--passes", type=int, default=1, help="Scrapes per student before stopping")
+    parser.add_argument("--duration", type=int, default=600, help="Maximum duration of the run, in seconds")
+    parser.add_argument("--engine", choices=["threads", "process"], default="threads", help="Scrape engine")
+    parser.add_argument("--max-threads", type=int, default=10, help="MAX_THREADS of the scraper")
+    parser.add_argument("--processes", type=int, default=2, help="SCRAPER_PROCESSES of the process engine")
+    parser.add_argument("--log-level", default="ERROR", help="LOG_LEVEL of the scraper")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    mock_servers.add_arguments(parser)
+    args = parser.parse_args()
+
+    students = make_students(args.students)
+    context = multiprocessing.get_context("spawn")
+    parent_connection, child_connection = context.Pipe()
+    mocks = context.Process(target=run_mock_servers, daemon=True,
+                            args=(mock_servers.config_from_args(args), students, child_connection))
+    mocks.start()
+    urls = parent_connection.recv()
+
+    config_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    # Every task is due once per pass: the interval is longer than the run
+    json.dump({"intervals": {key: args.duration + 60 for key in
+                             ["moulinettes", "projects", "planning", "modules", "profile"]},
+               "students": students}, config_file)
+    config_file.close()
+    os.environ.update(mock_servers.scraper_env(urls))
+    os.environ.update({"SCRAPER_MODE": "private", "SCRAPER_CONFIG_FILE": config_file.name,
+                       "MAX_THREADS": str(args.max_threads), "SCRAPER_PROCESSES": str(args.processes),
+                       "LOG_LEVEL": args.log_level})
+
+    from app.engine.process_pool import ProcessEngine
+    from app.main import Main
+    from app.model.Student import Student
+    from app.tools.metrics import HTTP_REQUESTS
+    from app.tools.status_sender import status_sender
+
+    durations = []
+    completed = {}
+    lock = threading.Lock()
+    scrape_now = Student.scrape_now
+
+    def timed_scrape_now(student):
+        pushes = student.push_count
+        start = time.perf_counter()
+        scrape_now(student)
+        if student.push_count > pushes:
+            with lock:
+                durations.append(time.perf_counter() - start)
+                completed[student.tekbetter_token] = completed.get(student.tekbetter_token, 0) + 1
+
+    Student.scrape_now = timed_scrape_now
+
+    # With the process engine, the scrapes run in the workers: they are timed from the dispatch to the result
+    apply_result = ProcessEngine.apply_result
+
+    def timed_apply_result(engine, result):
+        student = engine.main.get_student(result["token"])
+        dispatched_at, pushes = student.last_scrape_start, student.push_count
+        apply_result(engine, result)
+        if student.push_count > pushes:
+            with lock:
+                durations.append(time.time() - dispatched_at)
+                completed[student.tekbetter_token] = completed.get(student.tekbetter_token, 0) + 1
+
+    ProcessEngine.apply_result = timed_apply_result
+
+    try:
+        scraper = Main()
+        start = time.perf_counter()
+        if args.passes > 1:
+            # Make the students due again as soon as they pushed
+            for key in scraper.intervals:
+                scraper.intervals[key] = 0
+        scrape_until_done(scraper, args, completed)
+        elapsed = time.perf_counter() - start
+        status_sender.flush()
+    finally:
+        os.unlink(config_file.name)
+
+    results = {
+        "students": args.students,
+        "engine": args.engine,
+        "max_threads": args.max_threads,
+        "elapsed_seconds": round(elapsed, 2),
+        "scrapes": len(durations),
+        "students_per_minute": round(len(durations) / elapsed * 60, 1),
+        "scrape_seconds_p50": round(percentile(durations, 0.5), 3),
+        "scrape_seconds_p99": round(percentile(durations, 0.99), 3),
+        "scrape_seconds_mean": round(statistics.mean(durations), 3) if durations else 0.0,
+        # With the process engine, the requests are counted in the workers, whose metrics are not collected
+        "scraper_requests": None if args.engine == "process" else
+        {f"{s[1]['host']} {s[1]['status']}": s[2] for s in HTTP_REQUESTS.samples()},
+        "mock_requests": {name: fetch_stats(url) for name, url in urls.items()},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Largest of the terminated children: the workers of the process engine, the mock services still run
+        "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+    mocks.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['scrapes']} scrapes of {args.students} students in {results['elapsed_seconds']}s "
+          f"({args.engine} engine, {args.max_threads} threads)")
+    print(f"  throughput: {results['students_per_minute']} students/min")
+    print(f"  scrape time: p50 {results['scrape_seconds_p50']}s  p99 {results['scrape_seconds_p99']}s  "
+          f"mean {results['scrape_seconds_mean']}s")
+    print(f"  peak RSS: {results['peak_rss_mb']} MB")
+    if args.engine == "process":
+        print(f"  peak RSS of a worker: {results['peak_worker_rss_mb']} MB")
+    if results["scraper_requests"] is None:
+        print("  requests sent by the scraper: unavailable with the process engine (counted in the workers), "
+              "see the requests received by the mock services")
+    else:
+        print("  requests sent by the scraper:")
+        for key, count in sorted(results["scraper_requests"].items()):
+            print(f"    {key}: {count}")
+    print("  requests received by the mock services:")
+    for name, stats in results["mock_requests"].items():
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(stats["statuses"].items()))
+        print(f"    {name}: {stats['total']} ({statuses})")
+        for route, count in sorted(stats["requests"].items()):
+            print(f"      {route}: {count}")
+
+
+if __name__ == "__main__":
+    main()
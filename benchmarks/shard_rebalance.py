@@ -0,0 +1,133 @@
+"""
+Run several processes sharing a SHARD_MEMBERSHIP_DIR, and check that every student is owned by exactly one
+of them, and how many students move when an instance leaves, joins or dies without leaving.
+
+Usage: python -m benchmarks.shard_rebalance [--instances 4] [--students 10000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def make_tokens(count: int) -> list:
+    return [f"student{i}@epitech.eu_{i:08d}.shard" for i in range(count)]
+
+
+def run_member(students: int):
+    from app.engine.sharding import Sharding
+
+    tokens = make_tokens(students)
+    sharding = Sharding()
+    sharding.start()
+    for command in sys.stdin:
+        if command.strip() == "report":
+            owned = [i for i, token in enumerate(tokens) if sharding.owns(token)]
+            print(json.dumps({"instance": sharding.instance_id, "members": sharding.members, "owned": owned}),
+                  flush=True)
+        elif command.strip() == "leave":
+            sharding.leave()
+            return
+
+
+class Member:
+    def __init__(self, directory: str, instance_id: str, students: int):
+        env = dict(os.environ, SHARD_MEMBERSHIP_DIR=directory, SHARD_INSTANCE_ID=instance_id,
+                   SHARD_HEARTBEAT_INTERVAL="0.2", SHARD_MEMBER_TTL="1", LOG_LEVEL="WARNING")
+        self.instance_id = instance_id
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.shard_rebalance", "--member", "--students", str(students)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, text=True)
+
+    def report(self) -> dict:
+        self.process.stdin.write("report\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def leave(self):
+        self.process.stdin.write("leave\n")
+        self.process.stdin.flush()
+        self.process.wait()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def converge(members: list, timeout: float = 10) -> dict:
+    """
+    Wait until every member sees all the others
+    :return: Dict of student index -> owner
+    """
+    expected = sorted(m.instance_id for m in members)
+    deadline = time.time() + timeout
+    while True:
+        reports = [m.report() for m in members]
+        if all(r["members"] == expected for r in reports):
+            break
+        if time.time() > deadline:
+            raise Exception(f"Members did not converge: {[r['members'] for r in reports]}")
+        time.sleep(0.1)
+    owners = {}
+    for report in reports:
+        for index in report["owned"]:
+            if index in owners:
+                raise Exception(f"Student {index} owned by {owners[index]} and {report['instance']}")
+            owners[index] = report["instance"]
+    return owners
+
+
+def summarize(step: str, owners: dict, previous: dict, students: int):
+    if len(owners) != students:
+        raise Exception(f"{students - len(owners)} students owned by no instance")
+    counts = {}
+    for owner in owners.values():
+        counts[owner] = counts.get(owner, 0) + 1
+    moved = len([i for i in owners if previous and previous.get(i) != owners[i]])
+    shares = ", ".join(f"{owner}: {count}" for owner, count in sorted(counts.items()))
+    print(f"{step:<28} {shares}")
+    if previous:
+        print(f"{'':<28} {moved} students moved ({moved / students:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instances", type=int, default=4)
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--member", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.member:
+        run_member(args.students)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        members = [Member(directory, f"instance-{i}", args.students) for i in range(args.instances)]
+        try:
+            owners = converge(members)
+            summarize(f"{len(members)} instances", owners, {}, args.students)
+
+            leaving = members.pop()
+            leaving.leave()
+            previous, owners = owners, converge(members)
+            summarize(f"{leaving.instance_id} left", owners, previous, args.students)
+
+            members.append(Member(directory, f"instance-{args.instances}", args.students))
+            previous, owners = owners, converge(members)
+            summarize(f"instance-{args.instances} joined", owners, previous, args.students)
+
+            killed = members.pop(0)
+            killed.kill()
+            start = time.time()
+            previous, owners = owners, converge(members)
+            summarize(f"{killed.instance_id} killed", owners, previous, args.students)
+            print(f"{'':<28} taken over after {time.time() - start:.1f}s")
+        finally:
+            for member in members:
+                member.kill()
+
+
+if __name__ == "__main__":
+    main()
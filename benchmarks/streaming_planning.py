@@ -0,0 +1,83 @@
+"""
+Compare the peak memory of fetching one large planning window decoded whole (api_request) and streamed
+(api_stream), both filtered by the planning filter of IntranetManager.
+Each mode runs in its own process against the mock intranet of the load test, so its peak RSS is its own.
+
+Usage: python -m benchmarks.streaming_planning [--events 50000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.loadtest import mock_servers
+
+URL = "planning/load?start=2024-09-01&end=2024-11-10&format=json"
+
+
+def read_status_mb(field: str) -> float:
+    """
+    Memory field of /proc/self/status, in MB. VmHWM is the peak RSS of this process only: unlike ru_maxrss,
+    it doesn't inherit the peak of the parent which forked it (the mock servers, when generating the window).
+    """
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise Exception(f"No {field} in /proc/self/status")
+
+
+def run_mode(mode: str):
+    from app.intranet.intranet_antiddos_bypass import antiddos_cookies
+    from app.intranet.intranet_manager import IntranetManager
+    from app.model.Student import Student
+
+    student = Student()
+    student.tekbetter_token = "bench"
+    student.student_label = "bench@epitech.eu"
+    student.microsoft_session = "session-bench@epitech.eu"
+    student.antiddos = antiddos_cookies
+    manager = IntranetManager()
+    manager.fetch_student(student)  # Log in, and warm up the connection
+
+    baseline = read_status_mb("VmRSS")
+    start = time.perf_counter()
+    if mode == "stream":
+        kept = [e for e in manager.api.api_stream(URL, student) if manager._keep_planning_event(e)]
+    else:
+        kept = [e for e in manager.api.api_request(URL, student) if manager._keep_planning_event(e)]
+    duration = time.perf_counter() - start
+    peak = read_status_mb("VmHWM")
+    print(json.dumps({"mode": mode, "kept": len(kept), "seconds": duration, "baseline_mb": baseline,
+                      "peak_mb": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=50000, help="Events of the planning window")
+    parser.add_argument("--mode", choices=["full", "stream"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args.mode)
+        return
+
+    urls = mock_servers.start_all(mock_servers.MockConfig(latency=0, events_per_window=args.events))
+    env = dict(os.environ, **mock_servers.scraper_env(urls), LOG_LEVEL="ERROR", HTTP_RATE_LIMIT="0")
+    results = {}
+    for mode in ["full", "stream"]:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.streaming_planning", "--mode", mode],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"Planning window of {args.events} events")
+    for mode, result in results.items():
+        print(f"{mode:>7}: peak RSS {result['peak_mb']:7.1f} MB (+{result['peak_mb'] - result['baseline_mb']:6.1f} MB "
+              f"over the baseline)  {result['seconds']:.2f}s  {result['kept']} events kept")
+    if results["full"]["kept"] != results["stream"]["kept"]:
+        print("Warning: both modes did not keep the same events")
+
+
+if __name__ == "__main__":
+    main()